@@ -0,0 +1,169 @@
+# Declarative achievements. Each rule subscribes to the events that can make
+# it true, and commands report which events their mutation caused; only the
+# rules indexed under those events are checked. Earned achievements live in
+# User.achievements as a bitset, so a user who already has every rule of an
+# event is skipped with a single mask test. Milestones ("reach N of some
+# measure") are kept sorted per measure, so checking a hundred balance
+# milestones is a bisect plus a mask, not a hundred comparisons.
+
+from bisect import bisect_right, insort
+
+BALANCE = "balance"      # bal changed
+LEVEL = "level"          # lvl changed
+INVENTORY = "inventory"  # inv changed
+DAILY = "daily"          # daily reward claimed
+WORK = "work"            # worked a shift
+
+
+class Achievement:
+    __slots__ = ("key", "desc", "reward", "events", "condition", "bit")
+
+    def __init__(self, key, desc, reward, events, condition, bit):
+        self.key = key
+        self.desc = desc
+        self.reward = reward
+        self.events = events
+        self.condition = condition
+        self.bit = bit
+
+
+class AchievementEngine:
+    def __init__(self):
+        self.rules = {}
+        # Every key ever seen gets a bit, including ones read from storage
+        # whose rule has since been removed, so they survive a round trip.
+        self.bits = {}
+        self.keys = []
+        self.index = {}
+        self.milestones = {}
+        self.event_masks = {}
+
+    def bit(self, key):
+        if key not in self.bits:
+            self.bits[key] = len(self.keys)
+            self.keys.append(key)
+        return self.bits[key]
+
+    def add(self, key, desc, reward, on, condition):
+        events = (on,) if isinstance(on, str) else tuple(on)
+        rule = Achievement(key, desc, reward, events, condition, self.bit(key))
+        self.rules[key] = rule
+        for event in events:
+            self.index.setdefault(event, []).append(rule)
+            self.event_masks[event] = self.event_masks.get(event, 0) | (1 << rule.bit)
+        return rule
+
+    def add_milestone(self, key, desc, reward, on, measure, threshold):
+        # Earned once measure(user) >= threshold. Milestones sharing the same
+        # measure function are evaluated together.
+        events = (on,) if isinstance(on, str) else tuple(on)
+        rule = Achievement(key, desc, reward, events, lambda user: measure(user) >= threshold, self.bit(key))
+        self.rules[key] = rule
+        for event in events:
+            group = self.milestones.setdefault(event, {}).setdefault(measure, MilestoneGroup())
+            group.add(threshold, rule)
+            self.event_masks[event] = self.event_masks.get(event, 0) | (1 << rule.bit)
+        return rule
+
+    def evaluate(self, user, *events):
+        # Checks the rules subscribed to events and grants the ones that now
+        # hold. Rewards change the balance, which may unlock further
+        # balance rules, so BALANCE is re-queued after a paid reward.
+        earned = []
+        pending = list(events)
+        seen = set()
+        while pending:
+            event = pending.pop()
+            if event in seen:
+                continue
+            seen.add(event)
+            mask = self.event_masks.get(event, 0)
+            if user.achievements & mask == mask:
+                continue
+            granted = []
+            for rule in self.index.get(event, ()):
+                if not user.achievements & (1 << rule.bit) and rule.condition(user):
+                    granted.append(rule)
+            for measure, group in self.milestones.get(event, {}).items():
+                granted.extend(group.reached(measure(user), user.achievements))
+            for rule in granted:
+                user.achievements |= 1 << rule.bit
+                earned.append((rule.key, rule.desc, rule.reward))
+                if rule.reward:
+                    user.bal += rule.reward
+                    seen.discard(BALANCE)
+                    pending.append(BALANCE)
+        return earned
+
+    def to_bits(self, keys):
+        bits = 0
+        for key in keys:
+            bits |= 1 << self.bit(key)
+        return bits
+
+    def to_keys(self, bits):
+        keys = []
+        i = 0
+        while bits:
+            if bits & 1:
+                keys.append(self.keys[i])
+            bits >>= 1
+            i += 1
+        return keys
+
+
+class MilestoneGroup:
+    # Thresholds in ascending order with prefix[i] = bits of the first i
+    # rules, so the unearned rules reached at value v are
+    # prefix[bisect_right(thresholds, v)] & ~earned.
+
+    def __init__(self):
+        self.thresholds = []
+        self.rules = []
+        self.prefix = [0]
+        self.by_bit = {}
+
+    def add(self, threshold, rule):
+        i = bisect_right(self.thresholds, threshold)
+        insort(self.thresholds, threshold)
+        self.rules.insert(i, rule)
+        self.by_bit[rule.bit] = rule
+        self.prefix = [0]
+        for r in self.rules:
+            self.prefix.append(self.prefix[-1] | (1 << r.bit))
+
+    def reached(self, value, earned):
+        new = self.prefix[bisect_right(self.thresholds, value)] & ~earned
+        rules = []
+        while new:
+            low = new & -new
+            rules.append(self.by_bit[low.bit_length() - 1])
+            new ^= low
+        return rules
+
+
+# Shared measure functions; milestones on the same measure are grouped, so
+# always pass these rather than fresh lambdas.
+def balance(user):
+    return user.bal
+
+
+def level(user):
+    return user.lvl
+
+
+_holding = {}
+
+
+def holding(item):
+    if item not in _holding:
+        _holding[item] = lambda user: user.inv.get(item, 0)
+    return _holding[item]
+
+
+engine = AchievementEngine()
+
+engine.add("first_daily", "Claim your first daily reward", 500, on=DAILY, condition=lambda user: user.daily > 0)
+engine.add("first_work", "Work for the first time", 500, on=WORK, condition=lambda user: user.work > 0)
+engine.add_milestone("own_bitcoin", "Own at least 1 bitcoin", 1000, on=INVENTORY, measure=holding("bitcoin"), threshold=1)
+engine.add_milestone("level_5", "Reach level 5", 1500, on=LEVEL, measure=level, threshold=5)
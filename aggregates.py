@@ -0,0 +1,126 @@
+# Economy-wide totals (users, coins in circulation, crypto held and coins
+# invested per crypto) kept up to date as users change, so /economy and
+# the stats log never scan the economy.
+#
+# update() is a store listener. Committed records are never changed in
+# place (see storage.py), so the record a user had before a commit is
+# still intact when the new one arrives: its contribution is taken off
+# and the new one's added, which is O(1) per change (O(cryptos held) to be
+# exact). What the holdings are worth is only worked out from the totals
+# per crypto, in O(cryptos), when prices move or someone asks.
+#
+# Balances are floats, so the running coin total can drift from a fresh
+# sum by rounding; check() recomputes everything and reports any total
+# that is off by more than a relative TOLERANCE.
+
+import math
+
+TOLERANCE = 1e-9
+
+
+class Aggregates:
+    def __init__(self, assets):
+        self.assets = list(assets)
+        self.records = {}  # uid -> the record currently counted for them
+        self.users = 0
+        self.coins = 0.0
+        self.held = dict.fromkeys(self.assets, 0)      # units held per crypto
+        self.invested = dict.fromkeys(self.assets, 0)  # coins invested per crypto
+        self.prices = dict.fromkeys(self.assets, 0.0)
+        self.held_value = 0.0
+        self.invested_value = 0.0
+
+    def add(self, user, sign):
+        self.users += sign
+        self.coins += sign * user.bal
+        for asset, amount in user.inv.items():
+            self.held[asset] = self.held.get(asset, 0) + sign * amount
+        for asset, amount in user.investments.items():
+            self.invested[asset] = self.invested.get(asset, 0) + sign * amount
+
+    def update(self, uid, user):
+        # Store listener: the committed record, or None when the user was
+        # deleted.
+        old = self.records.pop(uid, None)
+        if old is not None:
+            self.add(old, -1)
+        if user is not None:
+            self.add(user, 1)
+            self.records[uid] = user
+
+    def build(self, data):
+        self.__init__(self.assets)
+        for uid, user in data.items():
+            self.update(uid, user)
+        self.revalue()
+
+    def revalue(self, prices=None):
+        # prices: one per asset, in self.assets order.
+        if prices is not None:
+            self.prices = dict(zip(self.assets, map(float, prices)))
+        self.held_value = sum(amount * self.prices.get(asset, 0.0) for asset, amount in self.held.items())
+        self.invested_value = sum(amount * self.prices.get(asset, 0.0) for asset, amount in self.invested.items())
+
+    def totals(self):
+        # A plain dict, so it can be logged, sent between workers and summed.
+        self.revalue()
+        return {
+            "users": self.users,
+            "coins": self.coins,
+            "held": dict(self.held),
+            "invested": dict(self.invested),
+            "held_value": self.held_value,
+            "invested_value": self.invested_value,
+            "prices": dict(self.prices),
+        }
+
+    def check(self, records, kept):
+        # Recomputes the totals from records, a copy of the store's data
+        # taken at the same moment as kept (our totals()), and compares.
+        # Safe to run on an I/O thread: neither argument changes under it.
+        return compare(kept, recompute(records, self.assets, kept["prices"]))
+
+
+def merge_totals(parts):
+    # Adds up the totals() of several workers (all at the same prices).
+    total = {"users": 0, "coins": 0.0, "held": {}, "invested": {}, "held_value": 0.0, "invested_value": 0.0,
+             "prices": parts[0]["prices"] if parts else {}}
+    for part in parts:
+        for key in ("users", "coins", "held_value", "invested_value"):
+            total[key] += part[key]
+        for key in ("held", "invested"):
+            for asset, amount in part[key].items():
+                total[key][asset] = total[key].get(asset, 0) + amount
+    return total
+
+
+def recompute(records, assets, prices):
+    # The same totals from a full pass over {uid: User}, summed exactly.
+    fresh = Aggregates(assets)
+    fresh.prices = dict(prices)
+    fresh.users = len(records)
+    fresh.coins = math.fsum(user.bal for user in records.values())
+    for user in records.values():
+        for asset, amount in user.inv.items():
+            fresh.held[asset] = fresh.held.get(asset, 0) + amount
+        for asset, amount in user.investments.items():
+            fresh.invested[asset] = fresh.invested.get(asset, 0) + amount
+    return fresh.totals()
+
+
+def compare(kept, fresh, tolerance=TOLERANCE):
+    # [(name, kept, recomputed)] for every total that doesn't match.
+    def close(a, b):
+        return math.isclose(a, b, rel_tol=tolerance, abs_tol=tolerance)
+
+    mismatches = []
+    for key in ("users", "coins", "held_value", "invested_value"):
+        if not close(kept[key], fresh[key]):
+            mismatches.append((key, kept[key], fresh[key]))
+    for key in ("held", "invested"):
+        for asset in sorted(set(kept[key]) | set(fresh[key])):
+            a, b = kept[key].get(asset, 0), fresh[key].get(asset, 0)
+            if not close(a, b):
+                mismatches.append((f"{key}[{asset}]", a, b))
+    return mismatches
+
@@ -0,0 +1,75 @@
+# Registers a few hundred synthetic achievements and times one evaluation
+# after a balance change, against the old approach of checking every rule.
+#
+#   python benchmarks/achievements.py --rules 500
+
+import argparse, os, random, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from achievements import AchievementEngine, BALANCE, LEVEL, INVENTORY, balance, level, holding
+from models import User
+
+
+def build_engine(n):
+    engine = AchievementEngine()
+    events = [BALANCE, LEVEL, INVENTORY]
+    for i in range(n):
+        event = events[i % 3]
+        if event == BALANCE:
+            engine.add_milestone(f"bal_{i}", f"Hold {i * 1000} coins", 0, on=BALANCE, measure=balance, threshold=i * 1000)
+        elif event == LEVEL:
+            engine.add_milestone(f"lvl_{i}", f"Reach level {i}", 0, on=LEVEL, measure=level, threshold=i)
+        else:
+            engine.add_milestone(f"inv_{i}", f"Own {i} dogecoin", 0, on=INVENTORY, measure=holding("dogecoin"), threshold=i)
+    return engine
+
+
+def scan_all(engine, user):
+    # What update_achievements used to do: every rule, every time.
+    earned = []
+    for rule in engine.rules.values():
+        if not user.achievements & (1 << rule.bit) and rule.condition(user):
+            user.achievements |= 1 << rule.bit
+            earned.append(rule.key)
+    return earned
+
+
+def bench(label, func, users, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for user in users:
+            func(user)
+    elapsed = time.perf_counter() - start
+    calls = repeat * len(users)
+    print(f"{label:<32} {elapsed / calls * 1e6:8.2f}µs per command")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, default=500)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    rng = random.Random(1)
+    engine = build_engine(args.rules)
+
+    def fresh_users():
+        users = []
+        for _ in range(args.users):
+            user = User()
+            user.bal = rng.randint(0, args.rules * 1000)
+            users.append(user)
+        return users
+
+    print(f"{args.rules} rules, {args.users} users")
+    bench("scan every rule", lambda u: scan_all(engine, u), fresh_users(), args.repeat)
+    bench("indexed, BALANCE event", lambda u: engine.evaluate(u, BALANCE), fresh_users(), args.repeat)
+    users = fresh_users()
+    for user in users:
+        engine.evaluate(user, BALANCE)
+    bench("indexed, after rules earned", lambda u: engine.evaluate(u, BALANCE), users, args.repeat)
+    bench("indexed, WORK (no rules)", lambda u: engine.evaluate(u, "work"), users, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# What the economy totals cost: keeping them up to date on every change
+# and revaluing them on a price tick, against the full scan /economy would
+# otherwise need. Also how far the running coin total drifts from an exact
+# recount after many float balance changes.
+#
+#   python benchmarks/aggregates.py --users 1000000
+
+import argparse, os, random, sys, time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from commands import populate
+from aggregates import Aggregates, recompute, compare
+
+CRYPTOS = ["bitcoin", "ethereum", "dogecoin", "litecoin", "ripple"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--changes", type=int, default=1_000_000)
+    parser.add_argument("--ticks", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    data = populate(args.users, 50, CRYPTOS, rng)
+    for user in data.values():
+        if rng.random() < 0.2:
+            user.investments = {rng.choice(CRYPTOS): rng.randint(100, 10_000)}
+    prices = [rng.uniform(0.1, 50_000) for _ in CRYPTOS]
+    aggregates = Aggregates(CRYPTOS)
+    start = time.perf_counter()
+    aggregates.build(data)
+    aggregates.revalue(prices)
+    build = time.perf_counter() - start
+    print(f"{args.users:,} users")
+    print(f"build at startup:     {build:.2f}s")
+
+    # Commits as commands make them: a copy of the user with a new balance
+    # (and sometimes new holdings) replaces the stored record.
+    uids = list(data)
+    changes = []
+    for _ in range(args.changes):
+        uid = rng.choice(uids)
+        user = data[uid].copy()
+        user.bal = round(user.bal + rng.uniform(-500, 1000), 2)
+        if rng.random() < 0.1:
+            user.inv = {**user.inv, rng.choice(CRYPTOS): rng.randint(1, 20)}
+        data[uid] = user
+        changes.append((uid, user))
+    start = time.perf_counter()
+    for uid, user in changes:
+        aggregates.update(uid, user)
+    update = (time.perf_counter() - start) / args.changes
+    print(f"update per change:    {update * 1e6:.2f}µs")
+
+    start = time.perf_counter()
+    for _ in range(args.ticks):
+        aggregates.revalue(prices)
+    tick = (time.perf_counter() - start) / args.ticks
+    print(f"revalue per tick:     {tick * 1e6:.2f}µs")
+
+    start = time.perf_counter()
+    fresh = recompute(data, CRYPTOS, aggregates.totals()["prices"])
+    scan = time.perf_counter() - start
+    print(f"full-scan recompute:  {scan:.2f}s ({scan / update:,.0f}x a change, {scan / tick:,.0f}x a tick)")
+
+    kept = aggregates.totals()
+    mismatches = compare(kept, fresh)
+    drift = abs(kept["coins"] - fresh["coins"])
+    print(f"coin drift after {args.changes:,} changes: {drift:.3g} coins of {fresh['coins']:,.2f} "
+          f"({'no mismatches' if not mismatches else f'{len(mismatches)} mismatches'})")
+
+
+if __name__ == "__main__":
+    main()
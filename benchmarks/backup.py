@@ -0,0 +1,102 @@
+# Time and peak memory of the streaming backup tools on a large economy,
+# against json.load-ing the whole economy.json the way a copy-and-inspect
+# backup (or the old migrate.py) had to. Each step runs in a fresh process
+# so its peak resident set is its own.
+#
+#   python benchmarks/backup.py --users 1000000
+
+import argparse, json, os, random, resource, shutil, subprocess, sys, tempfile, time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+STEPS = {
+    "json.load": "load economy.json whole (baseline)",
+    "export": "economy.json -> economy.jsonl.gz",
+    "import": "economy.jsonl.gz -> SQLite",
+    "export-sqlite": "SQLite -> economy.jsonl.gz",
+    "restore": "last user of the export -> economy.db",
+}
+
+
+def generate(path, users, seed):
+    # Written record by record so the generator itself stays small.
+    from backup import write_json_stream
+    from models import User
+    rng = random.Random(seed)
+    cryptos = ["bitcoin", "ethereum", "dogecoin", "litecoin", "ripple"]
+
+    def records():
+        for i in range(users):
+            user = User()
+            user.bal = rng.randint(0, 500_000)
+            user.lvl = rng.randint(1, 40)
+            user.exp = rng.randint(0, 5000)
+            user.daily = user.work = 1_700_000_000 + rng.randint(0, 10**7)
+            if rng.random() < 0.5:
+                user.inv = {rng.choice(cryptos): rng.randint(1, 50)}
+            if rng.random() < 0.3:
+                user.cooldowns = {"rob": user.work, "coinflip": user.work}
+            user.guilds = (rng.randint(1, 200),)
+            yield str(10**17 + i), user.to_dict()
+
+    write_json_stream(path, records())
+
+
+def run_step(step, volume, last_uid):
+    from backup import iter_records, write_jsonl, read_jsonl, upgraded, import_records, find_record, restore_record
+    data_file = os.path.join(volume, "economy.json")
+    export = os.path.join(volume, "economy.jsonl.gz")
+    if step == "json.load":
+        with open(data_file) as f:
+            count = len(json.load(f))
+    elif step == "export":
+        count = write_jsonl(export, iter_records(data_file, "json"))
+    elif step == "import":
+        count = import_records(upgraded(read_jsonl(export)), os.path.join(volume, "import", "economy.json"), "sqlite")
+    elif step == "export-sqlite":
+        count = write_jsonl(os.path.join(volume, "sqlite.jsonl.gz"), iter_records(os.path.join(volume, "import", "economy.json"), "sqlite"))
+    else:
+        record = find_record(export, last_uid)
+        restore_record(os.path.join(volume, "import", "economy.json"), "sqlite", last_uid, record)
+        count = 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--step", help=argparse.SUPPRESS)
+    parser.add_argument("--volume", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    last_uid = str(10**17 + args.users - 1)
+
+    if args.step:
+        start = time.perf_counter()
+        count = run_step(args.step, args.volume, last_uid)
+        seconds = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+        print(json.dumps({"seconds": seconds, "peak": peak, "count": count}))
+        return
+
+    volume = tempfile.mkdtemp(prefix="economy-backup-")
+    os.makedirs(os.path.join(volume, "import"))
+    try:
+        start = time.perf_counter()
+        generate(os.path.join(volume, "economy.json"), args.users, args.seed)
+        size = os.path.getsize(os.path.join(volume, "economy.json"))
+        print(f"{args.users:,} users, economy.json {size / 1e6:,.0f} MB (generated in {time.perf_counter() - start:.0f}s)")
+        print(f"{'step':<15}{'seconds':>9}{'peak RSS MB':>13}{'users':>11}")
+        for step, desc in STEPS.items():
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--step", step, "--volume", volume,
+                                  "--users", str(args.users)], capture_output=True, text=True, check=True).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"{step:<15}{r['seconds']:>9.1f}{r['peak'] / 1e6:>13,.0f}{r['count']:>11,}  {desc}")
+        print(f"economy.jsonl.gz {os.path.getsize(os.path.join(volume, 'economy.jsonl.gz')) / 1e6:,.0f} MB")
+    finally:
+        shutil.rmtree(volume)
+
+
+if __name__ == "__main__":
+    main()
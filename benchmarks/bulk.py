@@ -0,0 +1,100 @@
+# /bulk actions over everyone in a guild against running the single-user
+# admin command once per user, with FLUSH_INTERVAL=0 so every commit is
+# written through the way every admin command used to rewrite the file.
+# Uses main's real store, listeners and bulk_part, offline against a
+# throwaway data directory; the per-user path is timed on a sample and
+# scaled up.
+#
+#   python benchmarks/bulk.py --users 100000,300000 --storage json
+
+import argparse, asyncio, os, random, shutil, sys, tempfile, time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from commands import populate
+
+GUILD = 1
+ACTIONS = ("addmoney", "removemoney", "resetcooldowns", "resetuser")
+
+
+async def per_user(main, action, uids):
+    for uid in uids:
+        if action == "resetuser":
+            await main.store.remove(uid)
+            await main.store.flush()
+            continue
+        async with main.store.transaction(uid) as user:
+            if action == "addmoney":
+                user.bal += 100
+            elif action == "removemoney":
+                user.bal = max(0, user.bal - 100)
+            else:
+                user.cooldowns = {}
+
+
+async def run(args, main):
+    store = main.store
+    await store.load()
+    print(f"{'users':>9} {'action':<15} {'dry run ms':>11} {'bulk ms':>9} {'flushes':>8} {'per-user s':>11}")
+    for count in (int(n) for n in args.users.split(",")):
+        rng = random.Random(args.seed)
+        for action in ACTIONS:
+            # A fresh economy for every action; resetuser empties it.
+            store.data.clear()
+            store.data.update(populate(count, 50, main.market.names, rng))
+            for user in store.data.values():
+                user.guilds = (GUILD,)
+                user.cooldowns = {"rob": 1, "coinflip": 1}
+            main.leaderboards.__init__(main.market.names)
+            main.leaderboards.build(store.data, main.market.prices)
+            store.dirty.clear()
+
+            start = time.perf_counter()
+            await main.bulk_part(action, None, 100, GUILD, True)
+            dry = time.perf_counter() - start
+
+            flushes = [0]
+            flush = store.flush
+
+            async def counting_flush():
+                flushes[0] += 1
+                return await flush()
+
+            store.flush = counting_flush
+            sample = rng.sample(list(store.data), args.sample)
+            start = time.perf_counter()
+            await main.bulk_part(action, None, 100, GUILD, False)
+            applied = time.perf_counter() - start
+            del store.flush
+
+            # The old way, on a sample of users that still exist.
+            if action == "resetuser":
+                store.data.update(populate(count, 50, main.market.names, rng))
+                sample = rng.sample(list(store.data), args.sample)
+            start = time.perf_counter()
+            await per_user(main, action, sample)
+            scaled = (time.perf_counter() - start) / len(sample) * count
+            print(f"{count:>9,} {action:<15} {dry * 1000:>11.1f} {applied * 1000:>9.1f} {flushes[0]:>8} {scaled:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", default="100000,300000", help="users in the guild, comma separated")
+    parser.add_argument("--storage", default="json", choices=["json", "journal", "sqlite"])
+    parser.add_argument("--sample", type=int, default=5, help="users the per-user path is timed on")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    volume = tempfile.mkdtemp(prefix="economy-bulk-")
+    os.environ.update({"VOLUME_PATH": volume, "STORAGE_MODE": args.storage, "FLUSH_INTERVAL": "0",
+                       "FLUSH_THRESHOLD": "1000000000"})
+    import main as bot
+    try:
+        asyncio.run(run(args, bot))
+    finally:
+        bot.store.close()
+        shutil.rmtree(volume)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# Throughput against worker count: starts the real coordinator with 1, 2,
+# 4... worker processes, each importing main.py as a cluster worker that
+# owns its partition of the users, and has every worker drive the slash
+# command callbacks with fake interactions from random users (so with N
+# workers, (N-1)/N of the commands touch a user another worker owns).
+# Offline and seeded like benchmarks/commands.py.
+#
+#   python benchmarks/cluster.py --workers 1,2,4 --users 100000 --seconds 10
+#   python benchmarks/cluster.py --mix rob=1 --workers 2,4
+#
+# --conservation turns it into a check of cross-worker transactions: only
+# /rob, with no cooldown, so nearly every command moves coins between two
+# users who may live on two other workers. Whatever a rob adds or takes
+# away overall (fines, quest and achievement rewards) is counted for the
+# commands that succeed, and the run fails unless the coins on all workers
+# at the end differ from the start by exactly that. --hold-timeout makes
+# remote holds expire under load, so some robs have to abort cleanly.
+#
+#   python benchmarks/cluster.py --conservation --workers 3 --hold-timeout 0.005
+
+import argparse, asyncio, json, os, random, re, shutil, sys, tempfile, time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from commands import DEFAULT_MIX, Interaction, Response, command_args, parse_mix, percentiles, populate
+from cluster import Coordinator
+
+
+async def run_worker(args):
+    if args.hold_timeout:
+        from cluster import PartitionedStore
+        PartitionedStore.HOLD_TIMEOUT = args.hold_timeout
+    import main as bot
+    node = bot.cluster
+    rng = random.Random(args.seed * 1000 + node.worker)
+    random.seed(args.seed * 1000 + node.worker)
+    cryptos = bot.market.names
+
+    await bot.store.load()
+    users = populate(args.users, args.guilds, cryptos, random.Random(args.seed))
+    bot.store.data.update((uid, user) for uid, user in users.items() if node.owns(uid))
+    bot.leaderboards.build(bot.store.data, bot.market.prices)
+    coins = sum(user.bal for user in bot.store.data.values())
+    await node.start()
+
+    net = {}  # task -> coins its rob added to the two balances
+    if args.conservation:
+        do_rob = bot.do_rob
+
+        def counted_rob(user, target, member):
+            before = user.bal + target.bal
+            result = do_rob(user, target, member)
+            net[asyncio.current_task()] = user.bal + target.bal - before
+            return result
+
+        bot.do_rob = counted_rob
+        bot.cooldowns.add("rob", lambda user: 0, lambda user: 0, "")
+    minted = 0
+
+    mix = parse_mix("rob=1" if args.conservation else args.mix)
+    names, weights = list(mix), list(mix.values())
+    callbacks = {name: bot.tree.get_command(name).callback for name in names}
+    latencies = []
+    errors = {}
+    deadline = time.perf_counter() + args.seconds
+
+    async def session():
+        nonlocal minted
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            interaction = Interaction(rng.randint(1, args.users), rng.randint(1, args.guilds))
+            began = time.perf_counter()
+            try:
+                await callbacks[name](interaction, **command_args(name, rng, args.users, cryptos))
+                minted += net.pop(asyncio.current_task(), 0)
+            except Exception as e:
+                net.pop(asyncio.current_task(), None)
+                key = f"{name}: {type(e).__name__}: {re.sub(r'transaction [0-9.]+', 'transaction', str(e))}"
+                errors[key] = errors.get(key, 0) + 1
+            latencies.append(time.perf_counter() - began)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session() for _ in range(args.concurrency)))
+    wall = time.perf_counter() - start
+    # Keep serving the other workers' remote calls until all are done.
+    await node.barrier("done")
+    with open(os.path.join(os.environ["VOLUME_PATH"], f"result-{node.worker}.json"), "w") as f:
+        json.dump({"ops": len(latencies), "wall": wall, "latencies": latencies, "errors": errors,
+                   "users": len(bot.store.data), "start_coins": coins,
+                   "coins": sum(user.bal for user in bot.store.data.values()), "minted": minted}, f)
+    node.close()
+
+
+def run_cluster(args, workers):
+    volume = tempfile.mkdtemp(prefix="economy-cluster-")
+    env = {"VOLUME_PATH": volume, "STORAGE_MODE": args.storage, "FLUSH_INTERVAL": "30"}
+    command = [sys.executable, os.path.abspath(__file__), "--worker"] + sys.argv[1:]
+    try:
+        codes = asyncio.run(Coordinator(workers, command, port=0, env=env).run())
+        if any(codes):
+            raise SystemExit(f"❌ a worker failed: exit codes {codes}")
+        results = []
+        for k in range(workers):
+            with open(os.path.join(volume, f"result-{k}.json")) as f:
+                results.append(json.load(f))
+    finally:
+        shutil.rmtree(volume)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4", help="worker counts to compare")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent commands per worker")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="command=weight,...")
+    parser.add_argument("--storage", default="json", choices=["json", "journal", "sqlite"])
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per reply")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--conservation", action="store_true", help="rob-only run that checks no coins appear or vanish")
+    parser.add_argument("--hold-timeout", type=float, default=0, help="seconds before a remote hold expires (default: the store's)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    Response.latency = args.latency
+
+    if args.worker:
+        asyncio.run(run_worker(args))
+        return
+
+    print(f"{args.users:,} users, {args.concurrency} concurrent commands per worker, {args.seconds}s per run, "
+          f"{os.cpu_count()} CPUs")
+    print(f"{'workers':>7}{'commands/s':>12}{'speedup':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    baseline = None
+    for workers in (int(w) for w in args.workers.split(",")):
+        results = run_cluster(args, workers)
+        throughput = sum(r["ops"] / r["wall"] for r in results)
+        baseline = baseline or throughput
+        p50, _, p99 = percentiles([t for r in results for t in r["latencies"]])
+        errors = sum(sum(r["errors"].values()) for r in results)
+        print(f"{workers:>7}{throughput:>12,.0f}{throughput / baseline:>8.2f}x{p50:>9.2f}{p99:>9.2f}{errors:>8}")
+        for error in sorted({e for r in results for e in r["errors"]}):
+            print(f"        error: {error}")
+        if args.conservation:
+            start = sum(r["start_coins"] for r in results)
+            end = sum(r["coins"] for r in results)
+            minted = sum(r["minted"] for r in results)
+            print(f"        coins: {start:,} at the start, {end:,} at the end, {minted:+,} from fines and rewards")
+            if end != start + minted:
+                raise SystemExit(f"❌ {end - start - minted:+,} coins appeared or vanished across workers")
+
+
+if __name__ == "__main__":
+    main()
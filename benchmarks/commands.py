@@ -0,0 +1,301 @@
+# Headless load test: drives the real slash command callbacks registered on
+# main.tree with fake interactions, fully offline and seeded, against a
+# throwaway data directory. Reports throughput, latency percentiles per
+# command and where the time went: waiting for user locks, storage (record
+# bookkeeping and inline flushes), commit listeners (leaderboards),
+# replies (the simulated round trip plus waiting for the event loop, which
+# is where other commands and flushes show up) and the command logic itself.
+#
+#   python benchmarks/commands.py --users 100000 --concurrency 64 --ops 50000
+#   python benchmarks/commands.py --storage sqlite --flush-interval 0
+#   python benchmarks/commands.py --mix balance=5,coinflip=3,rob=1
+
+import argparse, asyncio, contextvars, os, random, shutil, sys, tempfile, time
+from contextlib import asynccontextmanager
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from models import User
+
+DEFAULT_MIX = "balance=25,coinflip=20,portfolio=10,work=8,buy=8,sell=5,rob=5,daily=5,invest=5,lootbox=4,leaderboard=5"
+
+
+class Perms:
+    administrator = True
+
+
+class Member:
+    def __init__(self, id):
+        self.id = id
+        self.display_name = f"user{id}"
+        self.mention = f"<@{id}>"
+        self.guild_permissions = Perms()
+
+
+class Response:
+    # Replies always yield to the event loop, like the HTTP call they stand
+    # in for; otherwise a worker would never give the others (or a flush)
+    # a chance to run.
+    latency = 0.0
+
+    def __init__(self):
+        self.messages = []
+        self.acc = None
+
+    async def send_message(self, content=None, **kwargs):
+        self.messages.append(content)
+        start = time.perf_counter()
+        await asyncio.sleep(self.latency)
+        if self.acc is not None:
+            self.acc["replies"] += time.perf_counter() - start
+
+    async def send(self, content=None, **kwargs):
+        await self.send_message(content, **kwargs)
+
+    async def defer(self, **kwargs):
+        pass
+
+
+class Interaction:
+    def __init__(self, user_id, guild_id):
+        self.user = Member(user_id)
+        self.guild_id = guild_id
+        self.response = Response()
+        self.followup = self.response
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def command_args(name, rng, users, cryptos):
+    # Plausible arguments for each command; anything unlisted takes none.
+    if name == "rob":
+        return {"member": Member(rng.randint(1, users))}
+    if name == "balance" and rng.random() < 0.2:
+        return {"member": Member(rng.randint(1, users))}
+    if name in ("buy", "sell"):
+        return {"crypto": rng.choice(cryptos), "amount": rng.randint(1, 5)}
+    if name == "invest":
+        return {"crypto": rng.choice(cryptos), "amount": rng.randint(10, 1000)}
+    if name == "cancel":
+        return {"order": rng.randint(1, 1000)}
+    if name == "coinflip":
+        return {"bet": rng.randint(1, 1000), "choice": rng.choice(["heads", "tails"])}
+    return {}
+
+
+def populate(users, guilds, cryptos, rng):
+    data = {}
+    for i in range(1, users + 1):
+        user = User()
+        user.bal = rng.randint(0, 50_000)
+        user.lvl = rng.randint(1, 20)
+        if rng.random() < 0.3:
+            user.inv = {rng.choice(cryptos): rng.randint(1, 20)}
+        user.guilds = (rng.randint(1, guilds),)
+        data[str(i)] = user
+    return data
+
+
+class Accounting:
+    # Per-command time split. Each worker task sets its own accumulator in
+    # a context variable and wrapped store methods charge their time to it,
+    # but only from the task that owns it: a flush task spawned from inside
+    # a command inherits the context and must not count. Time is exclusive,
+    # so delete() -> notify() -> leaderboards lands under "listeners", not
+    # twice.
+
+    def __init__(self):
+        self.current = contextvars.ContextVar("accounting", default=None)
+        self.flushes = 0
+        self.flush_time = 0.0
+
+    def begin(self):
+        acc = {"task": asyncio.current_task(), "nested": [], "lock": 0.0, "storage": 0.0, "listeners": 0.0, "replies": 0.0}
+        self.current.set(acc)
+        return acc
+
+    def owned(self):
+        acc = self.current.get()
+        return acc if acc and acc["task"] is asyncio.current_task() else None
+
+    def charge(self, acc, category, elapsed):
+        inner = acc["nested"].pop()
+        acc[category] += elapsed - inner
+        if acc["nested"]:
+            acc["nested"][-1] += elapsed
+
+    def wrap_sync(self, func, category):
+        def wrapper(*args):
+            acc = self.owned()
+            if acc is None:
+                return func(*args)
+            acc["nested"].append(0.0)
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self.charge(acc, category, time.perf_counter() - start)
+        return wrapper
+
+    def wrap_flush(self, func):
+        async def wrapper():
+            acc = self.owned()
+            if acc is not None:
+                acc["nested"].append(0.0)
+            start = time.perf_counter()
+            try:
+                return await func()
+            finally:
+                elapsed = time.perf_counter() - start
+                self.flushes += 1
+                self.flush_time += elapsed
+                if acc is not None:
+                    self.charge(acc, "storage", elapsed)
+        return wrapper
+
+    def wrap_lock(self, lock):
+        @asynccontextmanager
+        async def wrapper(*uids):
+            acc = self.owned()
+            start = time.perf_counter()
+            async with lock(*uids):
+                if acc is not None:
+                    acc["lock"] += time.perf_counter() - start
+                yield
+        return wrapper
+
+    def instrument(self, store):
+        for name in ("mark_dirty", "delete"):
+            setattr(store, name, self.wrap_sync(getattr(store, name), "storage"))
+        store.notify = self.wrap_sync(store.notify, "listeners")
+        store.flush = self.wrap_flush(store.flush)
+        store.lock = self.wrap_lock(store.lock)
+
+
+def percentiles(values):
+    if not values:
+        return 0.0, 0.0, 0.0
+    return tuple(np.percentile(np.array(values) * 1000, [50, 95, 99]))
+
+
+async def run(args, main):
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    store = main.store
+    cryptos = main.market.names
+
+    start = time.perf_counter()
+    await store.load()
+    store.data.update(populate(args.users, args.guilds, cryptos, rng))
+    store.dirty.update(store.data)
+    await store.flush()
+    main.leaderboards.build(store.data, main.market.prices)
+    print(f"setup: {args.users:,} users written to {args.storage} in {time.perf_counter() - start:.1f}s")
+
+    accounting = Accounting()
+    accounting.instrument(store)
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    callbacks = {name: main.tree.get_command(name).callback for name in names}
+    latencies = {name: [] for name in names}
+    categories = ("lock", "storage", "listeners", "replies")
+    split = dict.fromkeys(categories + ("total",), 0.0)
+    errors = {}
+    remaining = [args.ops]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            name = rng.choices(names, weights)[0]
+            interaction = Interaction(rng.randint(1, args.users), rng.randint(1, args.guilds))
+            kwargs = command_args(name, rng, args.users, cryptos)
+            acc = interaction.response.acc = accounting.begin()
+            began = time.perf_counter()
+            try:
+                await callbacks[name](interaction, **kwargs)
+            except Exception as e:
+                errors[f"{name}: {type(e).__name__}: {e}"] = errors.get(f"{name}: {type(e).__name__}: {e}", 0) + 1
+            elapsed = time.perf_counter() - began
+            latencies[name].append(elapsed)
+            split["total"] += elapsed
+            for category in categories:
+                split[category] += acc[category]
+
+    async def flusher():
+        while True:
+            await asyncio.sleep(args.flush_interval)
+            await store.flush()
+
+    background = asyncio.create_task(flusher()) if args.flush_interval > 0 else None
+    main.loop_lag.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    wall = time.perf_counter() - start
+    main.loop_lag.stop()
+    if background:
+        background.cancel()
+    await store.flush()
+
+    print(f"{args.ops:,} commands, concurrency {args.concurrency}, {args.storage} storage, "
+          f"flush interval {args.flush_interval}s")
+    print(f"{'command':<14}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name in names:
+        p50, p95, p99 = percentiles(latencies[name])
+        print(f"{name:<14}{len(latencies[name]):>8}{p50:>10.3f}{p95:>10.3f}{p99:>10.3f}")
+    p50, p95, p99 = percentiles([t for values in latencies.values() for t in values])
+    print(f"{'all':<14}{args.ops:>8}{p50:>10.3f}{p95:>10.3f}{p99:>10.3f}")
+    print(f"throughput: {args.ops / wall:,.0f} commands/s ({wall:.2f}s)")
+    total = split["total"] or 1
+    logic = split["total"] - sum(split[category] for category in categories)
+    print("time in commands: " + ", ".join(f"{category} {split[category] / total:.1%}" for category in categories)
+          + f", logic {logic / total:.1%}")
+    print(f"flushes: {accounting.flushes} taking {accounting.flush_time:.2f}s; {main.loop_lag.summary()}")
+    for error, count in errors.items():
+        print(f"error x{count}: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--ops", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="command=weight,...")
+    parser.add_argument("--storage", default="json", choices=["json", "journal", "sqlite"])
+    parser.add_argument("--flush-interval", type=float, default=30,
+                        help="seconds between background flushes; 0 flushes inside every command")
+    parser.add_argument("--flush-threshold", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per reply")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="keep the data directory")
+    args = parser.parse_args()
+
+    volume = tempfile.mkdtemp(prefix="economy-bench-")
+    os.environ.update({
+        "VOLUME_PATH": volume,
+        "STORAGE_MODE": args.storage,
+        "FLUSH_INTERVAL": str(int(args.flush_interval)),
+        "FLUSH_THRESHOLD": str(args.flush_threshold),
+    })
+    Response.latency = args.latency
+    import main as bot
+    try:
+        asyncio.run(run(args, bot))
+    finally:
+        bot.store.close()
+        if args.keep:
+            print(f"data kept in {volume}")
+        else:
+            shutil.rmtree(volume)
+
+
+if __name__ == "__main__":
+    main()
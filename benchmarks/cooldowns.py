@@ -0,0 +1,59 @@
+# Schedules millions of cooldown/booster timers in the timing wheel and
+# times advancing it second by second, against a polling loop that checks
+# every user each second.
+#
+#   python benchmarks/cooldowns.py --timers 2000000 --seconds 600
+
+import argparse, os, random, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from cooldowns import TimingWheel
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--timers", type=int, default=2_000_000)
+    parser.add_argument("--seconds", type=int, default=600, help="simulated seconds to advance")
+    parser.add_argument("--span", type=int, default=24 * 3600, help="timers expire within this many seconds")
+    args = parser.parse_args()
+    rng = random.Random(1)
+    now = 1_700_000_000
+    expiries = [(str(i), now + rng.randint(1, args.span)) for i in range(args.timers)]
+
+    wheel = TimingWheel(now)
+    start = time.perf_counter()
+    for uid, expires in expiries:
+        wheel.schedule((uid, "work"), expires)
+    scheduled = time.perf_counter() - start
+    print(f"{args.timers:,} timers over {args.span}s")
+    print(f"schedule                     {scheduled / args.timers * 1e6:8.2f}µs per timer")
+
+    start = time.perf_counter()
+    for uid, expires in expiries[:100_000]:
+        wheel.schedule((uid, "work"), expires + 60)
+    print(f"reschedule                   {(time.perf_counter() - start) / 100_000 * 1e6:8.2f}µs per timer")
+
+    fired = 0
+    worst = 0.0
+    start = time.perf_counter()
+    for second in range(1, args.seconds + 1):
+        tick = time.perf_counter()
+        fired += len(wheel.advance(now + second))
+        worst = max(worst, time.perf_counter() - tick)
+    elapsed = time.perf_counter() - start
+    print(f"wheel advance                {elapsed / args.seconds * 1e3:8.3f}ms per second "
+          f"(worst {worst * 1e3:.1f}ms, {fired:,} fired)")
+
+    table = dict(expiries)
+    start = time.perf_counter()
+    polls = 5
+    found = 0
+    for second in range(1, polls + 1):
+        due = [uid for uid, expires in table.items() if expires <= now + second]
+        found += len(due)
+    print(f"polling every user           {(time.perf_counter() - start) / polls * 1e3:8.3f}ms per second "
+          f"({found:,} due over {polls} polls)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# Startup time and memory of the default gateway configuration against lean
+# mode (gateway.client_options). Each configuration runs in a fresh process
+# whose discord.Client is fed what Discord sends on connect, straight into
+# discord.py's parsers and fully offline: READY, one GUILD_CREATE per guild
+# (with the online members and their presences when those intents are on)
+# and, for every guild the client asks to chunk, GUILD_MEMBERS_CHUNK events
+# of 1000 members. Payloads are built as they are sent, standing in for
+# decoding them off the socket. Startup is READY to on_ready; memory is
+# the resident set size it added.
+#
+#   python benchmarks/gateway.py --guilds 20 --members 20000
+
+import argparse, asyncio, gc, json, os, subprocess, sys, time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+import discord
+from gateway import client_options
+
+BOT_ID = 1
+CHUNK = 1000
+
+
+def rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, AttributeError, ValueError):
+        import resource  # peak rather than current, but close enough here
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def member_id(guild, i):
+    return 10_000_000 * (guild + 1) + i
+
+
+def member_payload(guild, i):
+    uid = member_id(guild, i)
+    return {
+        "user": {"id": str(uid), "username": f"user{uid}", "global_name": f"User {uid}", "discriminator": "0",
+                 "avatar": f"{uid:032x}"},
+        "roles": [str(900 + guild * 10 + i % 5)], "joined_at": "2024-01-01T00:00:00+00:00",
+        "nick": None, "deaf": False, "mute": False, "flags": 0,
+    }
+
+
+def presence_payload(guild, i):
+    return {
+        "user": {"id": str(member_id(guild, i))}, "status": "online", "client_status": {"desktop": "online"},
+        "activities": [{"name": "Some Game", "type": 0, "created_at": 1700000000000}],
+    }
+
+
+def guild_payload(guild, args, intents):
+    online = int(args.members * args.online) if intents.presences else 0
+    members = [member_payload(guild, i) for i in range(online)]
+    members.append({"user": {"id": str(BOT_ID), "username": "bot", "discriminator": "0", "avatar": None, "bot": True},
+                    "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0})
+    return {
+        "id": str(guild + 1), "name": f"guild {guild}", "owner_id": "2", "member_count": args.members,
+        "large": args.members > 250, "unavailable": False, "features": [], "emojis": [], "stickers": [],
+        "roles": [{"id": str(900 + guild * 10 + r), "name": f"role{r}", "permissions": "0", "position": r,
+                   "color": 0, "hoist": False, "managed": False, "mentionable": False} for r in range(5)],
+        "channels": [{"id": str(500_000 + guild * 100 + c), "type": 0, "name": f"channel{c}", "position": c,
+                      "permission_overwrites": []} for c in range(args.channels)],
+        "members": members,
+        "presences": [presence_payload(guild, i) for i in range(online)],
+        "voice_states": [], "threads": [], "stage_instances": [], "guild_scheduled_events": [],
+    }
+
+
+class FakeGateway:
+    # Stands in for the websocket: answers member chunk requests the way
+    # Discord does, CHUNK members per GUILD_MEMBERS_CHUNK event.
+    open = False
+
+    def __init__(self, state, members):
+        self.state = state
+        self.members = members
+        self.chunks_sent = 0
+
+    async def request_chunks(self, guild_id, query=None, *, limit, user_ids=None, presences=False, nonce=None):
+        asyncio.get_running_loop().create_task(self.send_chunks(int(guild_id) - 1, nonce))
+
+    async def send_chunks(self, guild, nonce):
+        count = -(-self.members // CHUNK)
+        for index in range(count):
+            members = [member_payload(guild, i) for i in range(index * CHUNK, min(self.members, (index + 1) * CHUNK))]
+            self.state.parse_guild_members_chunk({
+                "guild_id": str(guild + 1), "members": members, "chunk_index": index, "chunk_count": count, "nonce": nonce,
+            })
+            self.chunks_sent += 1
+            await asyncio.sleep(0)
+
+
+async def measure(args):
+    gc.collect()
+    before = rss()
+    options = client_options(args.config == "lean")
+    client = discord.Client(guild_ready_timeout=args.ready_timeout, **options)
+    async with client:  # sets up the loop-bound parts without logging in
+        state = client._connection
+        gateway = client.ws = FakeGateway(state, args.members)
+        start = time.perf_counter()
+        state.parse_ready({
+            "v": 10, "session_id": "bench", "resume_gateway_url": "wss://localhost",
+            "user": {"id": str(BOT_ID), "username": "bot", "discriminator": "0", "avatar": None, "bot": True},
+            "application": {"id": str(BOT_ID), "flags": 0},
+            "guilds": [{"id": str(g + 1), "unavailable": True} for g in range(args.guilds)],
+        })
+        for guild in range(args.guilds):
+            state.parse_guild_create(guild_payload(guild, args, options["intents"]))
+            await asyncio.sleep(0)
+        await client.wait_until_ready()
+        startup = time.perf_counter() - start
+        gc.collect()
+        return {
+            "startup": startup, "rss": rss() - before, "chunks": gateway.chunks_sent,
+            "members": sum(len(g.members) for g in client.guilds), "users": len(client.users),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--members", type=int, default=20_000, help="members per guild")
+    parser.add_argument("--online", type=float, default=0.1, help="fraction online, sent with GUILD_CREATE")
+    parser.add_argument("--channels", type=int, default=30, help="channels per guild")
+    parser.add_argument("--ready-timeout", type=float, default=0.05,
+                        help="discord.py's wait after the last GUILD_CREATE (2s by default; same for both)")
+    parser.add_argument("--config", choices=["all", "lean"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.config:
+        print(json.dumps(asyncio.run(measure(args))))
+        return
+
+    print(f"{args.guilds} guilds x {args.members:,} members ({args.online:.0%} online), {args.channels} channels each")
+    print(f"{'config':<8}{'startup s':>11}{'RSS MB':>9}{'members':>11}{'users':>10}{'chunks':>8}")
+    for config in ("all", "lean"):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--config", config] + sys.argv[1:],
+                             capture_output=True, text=True, check=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        print(f"{config:<8}{r['startup']:>11.2f}{r['rss'] / 1e6:>9.1f}{r['members']:>11,}{r['users']:>10,}{r['chunks']:>8}")
+
+
+if __name__ == "__main__":
+    main()
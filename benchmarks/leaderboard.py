@@ -0,0 +1,118 @@
+# Builds the leaderboards for a large synthetic economy and times the
+# operations /leaderboard and every committed change depend on.
+#
+#   python benchmarks/leaderboard.py --users 1000000 --guilds 200
+
+import argparse, asyncio, os, random, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from leaderboard import Leaderboards
+from models import User
+
+ASSETS = {"bitcoin": 50000, "ethereum": 3200, "dogecoin": 0.3, "litecoin": 180, "ripple": 1}
+
+
+def synthetic(n, guilds, rng):
+    data = {}
+    names = list(ASSETS)
+    for i in range(n):
+        user = User()
+        user.bal = rng.randint(0, 1_000_000)
+        user.lvl = rng.randint(1, 50)
+        user.exp = rng.randint(0, 999)
+        if rng.random() < 0.3:
+            user.inv = {rng.choice(names): rng.randint(1, 100)}
+        user.guilds = (rng.randrange(guilds),)
+        data[str(i)] = user
+    return data
+
+
+def timed(label, func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    per = (time.perf_counter() - start) / repeat
+    unit, scale = ("ms", 1e3) if per >= 1e-3 else ("µs", 1e6)
+    print(f"{label:<40} {per * scale:10.1f}{unit}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--guilds", type=int, default=200)
+    parser.add_argument("--ops", type=int, default=2000)
+    args = parser.parse_args()
+    rng = random.Random(1)
+    data = synthetic(args.users, args.guilds, rng)
+    uids = list(data)
+    boards = Leaderboards(ASSETS)
+
+    print(f"{args.users:,} users in {args.guilds} guilds")
+    timed("build (startup)", lambda: boards.build(data, ASSETS))
+    timed("top 10, global balance", lambda: boards.top("balance", 10), args.ops)
+    timed("top 10, guild networth", lambda: boards.top("networth", 10, 0), args.ops)
+    timed("my rank, global balance", lambda: boards.rank("balance", rng.choice(uids)), args.ops)
+    timed("my rank, global networth", lambda: boards.rank("networth", rng.choice(uids)), args.ops)
+
+    def change():
+        uid = rng.choice(uids)
+        user = data[uid].copy()
+        user.bal = rng.randint(0, 1_000_000)
+        data[uid] = user
+        boards.update(uid, user)
+
+    timed("committed change (all boards)", change, args.ops)
+    prices = dict(ASSETS)
+
+    def tick():
+        for name in prices:
+            prices[name] *= 1 + rng.uniform(-0.03, 0.03)
+        boards.revalue(prices)
+
+    timed("price tick re-valuation", tick, 3)
+
+    async def tick_in_thread():
+        # The tick as market_tick runs it, with commands committing changes
+        # (some of them moving users between guilds) while the sorts are
+        # in the worker thread.
+        for name in prices:
+            prices[name] *= 1 + rng.uniform(-0.03, 0.03)
+        done, stall, changes = False, 0.0, 0
+
+        async def commands():
+            nonlocal stall, changes
+            last = time.perf_counter()
+            while not done:
+                uid = rng.choice(uids)
+                user = data[uid].copy()
+                user.bal = rng.randint(0, 1_000_000)
+                if rng.random() < 0.1:
+                    user.guilds = (rng.randrange(args.guilds),)
+                data[uid] = user
+                boards.update(uid, user)
+                changes += 1
+                await asyncio.sleep(0)
+                now = time.perf_counter()
+                stall, last = max(stall, now - last), now
+
+        task = asyncio.create_task(commands())
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        await boards.revalue_in_thread(prices)
+        elapsed = time.perf_counter() - start
+        done = True
+        await task
+        return elapsed, stall, changes
+
+    elapsed, stall, changes = asyncio.run(tick_in_thread())
+    print(f"{'price tick, sorting in a thread':<40} {elapsed * 1e3:10.1f}ms "
+          f"(longest the loop waited: {stall * 1e3:.1f}ms; {changes:,} changes meanwhile)")
+    fresh = Leaderboards(ASSETS)
+    fresh.build(data, prices)
+    same = all(boards.top("networth", 100, guild) == fresh.top("networth", 100, guild) for guild in (None, *range(args.guilds)))
+    same = same and all(boards.rank("networth", uid) == fresh.rank("networth", uid) for uid in rng.sample(uids, 1000))
+    print(f"{'':<40} {'matches a full rebuild' if same else 'DOES NOT match a full rebuild'}")
+
+
+if __name__ == "__main__":
+    main()
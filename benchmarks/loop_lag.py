@@ -0,0 +1,56 @@
+# Shows how long the event loop stays blocked while the economy is written,
+# first with the backend called directly on the loop (what save_data used to
+# do) and then through EconomyStore.flush(), which hands the write to the
+# I/O thread pool.
+#
+#   python benchmarks/loop_lag.py --users 200000 --mode json
+
+import argparse, asyncio, os, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from storage import open_store
+from models import User
+from monitor import LoopLagMonitor
+
+
+async def measure(store, monitor, label, write):
+    store.dirty.update(store.data)
+    await asyncio.sleep(monitor.interval * 2)
+    monitor.reset_max()
+    start = time.perf_counter()
+    await write()
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(monitor.interval * 2)
+    print(f"{label:<28} write {elapsed * 1000:8.1f}ms   worst loop lag {monitor.reset_max() * 1000:8.1f}ms")
+
+
+async def run(args):
+    path = os.path.join(tempfile.mkdtemp(), "economy.json")
+    store = open_store(path, args.mode, flush_threshold=10**9)
+    await store.load()
+    for i in range(args.users):
+        store.data[str(i)] = User()
+
+    monitor = LoopLagMonitor(interval=0.01, warn_after=10**9)
+    monitor.start()
+
+    async def on_loop():
+        store.write_records(dict(store.data), set(store.dirty))
+        store.dirty.clear()
+
+    await measure(store, monitor, "backend write on the loop", on_loop)
+    await measure(store, monitor, "store.flush() via executor", store.flush)
+    monitor.stop()
+    store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--mode", default="json", choices=["json", "journal", "sqlite"])
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
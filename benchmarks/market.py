@@ -0,0 +1,56 @@
+# Times one market tick for a large listing with the vectorized engine
+# against the old per-coin dict loop, and a window summary over a full
+# history buffer.
+#
+#   python benchmarks/market.py --assets 500 --history 5040
+
+import argparse, os, random, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from market import Market, sparkline
+
+
+def listings(n):
+    return {f"coin{i}": {"price": 10 + i, "vol": 0.02, "desc": ""} for i in range(n)}
+
+
+def legacy_tick(cryptos):
+    # What investment_price_fluctuation used to do.
+    for crypto in cryptos:
+        change_percent = random.uniform(-0.03, 0.03)
+        new_price = cryptos[crypto]["price"] * (1 + change_percent)
+        cryptos[crypto]["price"] = round(max(new_price, 0.01), 2)
+
+
+def timed(label, func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    per = (time.perf_counter() - start) / repeat
+    print(f"{label:<40} {per * 1e6:10.1f}µs")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--assets", type=int, default=500)
+    parser.add_argument("--history", type=int, default=5040)
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+    cryptos = listings(args.assets)
+    market = Market(cryptos, model="gbm", correlation=0.3, history=args.history, seed=1)
+    clock = iter(range(10**9, 2 * 10**9, 120))
+
+    print(f"{args.assets} assets, {args.history} ticks of history")
+    timed("legacy tick (dict loop, no history)", lambda: legacy_tick(cryptos), args.repeat)
+    timed("vectorized tick + history", lambda: market.step(next(clock)), args.repeat)
+    for _ in range(args.history):
+        market.step(next(clock))
+    now = next(clock)
+    timed("stats, 24h window", lambda: market.stats("coin7", 24 * 3600, now), args.repeat)
+    timed("stats, full history", lambda: market.stats("coin7", args.history * 120, now), args.repeat)
+    timed("chart, full history", lambda: sparkline(market.window("coin7", args.history * 120, now)[1]), args.repeat)
+    print(f"history buffer: {market.history.prices.nbytes / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Settling one market tick's orders in a batch, at increasing order counts,
+# against the old way of executing every /buy and /sell as its own
+# transaction. Uses main's real store, listeners (leaderboards, cooldown
+# timers) and settle_orders, offline against a throwaway data directory.
+# "stall ms" is the longest settlement kept the event loop to itself.
+#
+#   python benchmarks/orders.py --users 100000 --orders 10000,100000,1000000
+
+import argparse, asyncio, os, random, shutil, sys, tempfile, time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from commands import populate
+from orders import OrderBook, BUY, SELL, apply_fill
+
+
+def place_random(book, count, users, market, rng):
+    # Market and limit orders; limits within 2% of the price either way,
+    # so roughly half of them cross on the next tick.
+    for _ in range(count):
+        asset = rng.choice(market.names)
+        price = market.price(asset)
+        side = BUY if rng.random() < 0.6 else SELL
+        limit = None if rng.random() < 0.3 else round(price * rng.uniform(0.98, 1.02), 2)
+        book.place(str(rng.randint(1, users)), side, asset, rng.randint(1, 5), limit)
+
+
+async def probe(longest):
+    # The longest the event loop went without coming back to this task:
+    # what a command arriving during settlement could have waited.
+    last = time.perf_counter()
+    while True:
+        await asyncio.sleep(0)
+        now = time.perf_counter()
+        longest[0] = max(longest[0], now - last)
+        last = now
+
+
+async def run(args, main):
+    rng = random.Random(args.seed)
+    store = main.store
+    await store.load()
+    store.data.update(populate(args.users, 50, main.market.names, rng))
+    main.leaderboards.build(store.data, main.market.prices)
+    main.cooldowns.build(store.data)
+    print(f"{args.users:,} users; {'orders':>9} {'place µs':>9} {'match ms':>9} {'settle ms':>10} "
+          f"{'stall ms':>9} {'fills':>8} {'commits':>8} {'per-order tx ms':>16}")
+
+    for count in (int(n) for n in args.orders.split(",")):
+        main.book = book = OrderBook(main.market.names, max_open=count)
+        start = time.perf_counter()
+        place_random(book, count, args.users, main.market, random.Random(count))
+        placed = time.perf_counter() - start
+        prices = main.market.step()
+
+        # Matching alone, on an identical book.
+        twin = OrderBook(main.market.names, max_open=count)
+        place_random(twin, count, args.users, main.market, random.Random(count))
+        start = time.perf_counter()
+        fills = twin.match(prices)
+        matched = time.perf_counter() - start
+
+        commits = [0]
+        commit = store.commit
+
+        async def counting_commit(working):
+            commits[0] += 1
+            await commit(working)
+
+        store.commit = counting_commit
+        stall = [0.0]
+        watcher = asyncio.create_task(probe(stall))
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        await main.settle_orders(prices)
+        settled = time.perf_counter() - start
+        watcher.cancel()
+        del store.commit
+
+        # The old path: one transaction (and with FLUSH_INTERVAL=0 one
+        # write) per order, timed on a sample and scaled up.
+        sample = fills[:args.sample]
+        start = time.perf_counter()
+        for order, price in sample:
+            async with store.transaction(order.uid) as user:
+                apply_fill(user, order, price)
+        per_order = (time.perf_counter() - start) / max(1, len(sample)) * len(fills)
+        await store.flush()
+
+        print(f"{'':>{len(f'{args.users:,} users;')}} {count:>9,} {placed / count * 1e6:>9.2f} {matched * 1000:>9.1f} "
+              f"{settled * 1000:>10.1f} {stall[0] * 1000:>9.1f} {len(fills):>8,} {commits[0]:>8} {per_order * 1000:>16.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--orders", default="10000,100000,1000000", help="order counts to settle")
+    parser.add_argument("--sample", type=int, default=20_000, help="fills replayed one transaction each")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    volume = tempfile.mkdtemp(prefix="economy-orders-")
+    os.environ.update({"VOLUME_PATH": volume, "FLUSH_INTERVAL": "30", "FLUSH_THRESHOLD": "1000000000"})
+    import main as bot
+    try:
+        asyncio.run(run(args, bot))
+    finally:
+        bot.store.close()
+        shutil.rmtree(volume)
+
+
+if __name__ == "__main__":
+    main()
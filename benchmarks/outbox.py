@@ -0,0 +1,183 @@
+# Delivered notices per second under a burst, through the outbox against
+# firing one request per notice, and how long each notice took to arrive. Both talk HTTP to a local fake of
+# Discord's create-message endpoint that enforces Discord-style limits: a
+# global bucket (50 requests per second) and a per-channel window (5
+# messages per 5 seconds), answering with the usual X-RateLimit-* headers
+# and 429s with Retry-After. Nothing leaves the machine.
+#
+#   python benchmarks/outbox.py --notices 1000 --users 500 --spread 10
+
+import argparse, asyncio, os, random, re, sys, time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from aiohttp import web, ClientSession
+from outbox import Outbox, RateLimited, TokenBucket, USER
+
+
+class FakeDiscord:
+    def __init__(self, global_rate, route_limit, route_window, latency):
+        self.bucket = TokenBucket(global_rate)
+        self.route_limit = route_limit
+        self.route_window = route_window
+        self.latency = latency
+        self.windows = {}  # channel -> (window start, requests in it)
+        self.requests = 0
+        self.limited = 0
+        self.delivered = {}  # notice number -> when it arrived
+
+    async def create_message(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        now = time.monotonic()
+        wait = self.bucket.take(now)
+        if wait:
+            self.bucket.tokens += 1  # refused, so not spent
+            self.limited += 1
+            return web.json_response({"message": "You are being rate limited.", "retry_after": wait, "global": True},
+                                     status=429, headers={"Retry-After": f"{wait:.3f}", "X-RateLimit-Global": "true",
+                                                          "X-RateLimit-Scope": "global"})
+        channel = request.match_info["channel"]
+        start, count = self.windows.get(channel, (now, 0))
+        if now - start >= self.route_window:
+            start, count = now, 0
+        reset_after = f"{start + self.route_window - now:.3f}"
+        if count >= self.route_limit:
+            self.bucket.tokens += 1
+            self.limited += 1
+            return web.json_response({"message": "You are being rate limited.", "retry_after": float(reset_after), "global": False},
+                                     status=429, headers={"Retry-After": reset_after, "X-RateLimit-Remaining": "0",
+                                                          "X-RateLimit-Reset-After": reset_after, "X-RateLimit-Scope": "user"})
+        self.windows[channel] = (start, count + 1)
+        content = (await request.json())["content"]
+        for number in re.findall(r"#(\d+)", content):
+            self.delivered[int(number)] = now
+        return web.json_response({"id": str(self.requests), "content": content},
+                                 headers={"X-RateLimit-Limit": str(self.route_limit),
+                                          "X-RateLimit-Remaining": str(self.route_limit - count - 1),
+                                          "X-RateLimit-Reset-After": reset_after, "X-RateLimit-Bucket": channel})
+
+
+async def post_message(session, url, channel, content):
+    # One create-message request; 429s raise RateLimited, anything else
+    # hands back the headers.
+    async with session.post(f"{url}/channels/{channel}/messages", json={"content": content}) as resp:
+        await resp.read()
+        if resp.status == 429:
+            raise RateLimited.from_headers(resp.headers)
+        return resp.headers
+
+
+def burst(args):
+    # (seconds in, uid, text) in arrival order, spread evenly over
+    # args.spread seconds; a few users get most of the notices.
+    rng = random.Random(args.seed)
+    weights = [1 / (i + 1) for i in range(args.users)]
+    uids = rng.choices(range(args.users), weights, k=args.notices)
+    return [(i * args.spread / args.notices, str(uid), f"🔔 Notice #{i} for {uid}") for i, uid in enumerate(uids)]
+
+
+async def arrive(notices, start, handle):
+    # Calls handle(uid, text) for each notice at its time, in batches of
+    # whatever is due.
+    i = 0
+    while i < len(notices):
+        due = time.monotonic() - start
+        while i < len(notices) and notices[i][0] <= due:
+            handle(notices[i][1], notices[i][2])
+            i += 1
+        await asyncio.sleep(0.005)
+
+
+async def naive(session, url, notices, start, concurrency):
+    # Every notice its own request, as many in flight as allowed, each
+    # retried after the Retry-After it gets back.
+    gate = asyncio.Semaphore(concurrency)
+    tasks = []
+
+    async def one(uid, text):
+        async with gate:
+            while True:
+                try:
+                    return await post_message(session, url, uid, text)
+                except RateLimited as e:
+                    await asyncio.sleep(e.retry_after)
+
+    await arrive(notices, start, lambda uid, text: tasks.append(asyncio.ensure_future(one(uid, text))))
+    await asyncio.gather(*tasks)
+    return None
+
+
+async def queued(session, url, notices, start, args):
+    # Returns the time spent in post(), which is all a handler waits for.
+    async def send(dest, content):
+        return await post_message(session, url, dest[1], content)
+
+    outbox = Outbox(send, args.global_rate, args.global_rate, args.workers)
+    outbox.start()
+    posting = 0.0
+
+    def post(uid, text):
+        nonlocal posting
+        begin = time.perf_counter()
+        outbox.post((USER, uid), text)
+        posting += time.perf_counter() - begin
+
+    await arrive(notices, start, post)
+    while outbox.pending or outbox.sending:
+        await asyncio.sleep(0.01)
+    outbox.stop()
+    return posting
+
+
+async def run(args):
+    notices = burst(args)
+    results = []
+    for label in ("one request per notice", "outbox"):
+        fake = FakeDiscord(args.global_rate, args.route_limit, args.route_window, args.latency / 1000)
+        app = web.Application()
+        app.router.add_post("/channels/{channel}/messages", fake.create_message)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        async with ClientSession() as session:
+            start = time.monotonic()
+            if label == "outbox":
+                posting = await queued(session, url, notices, start, args)
+            else:
+                posting = await naive(session, url, notices, start, args.concurrency)
+        await runner.cleanup()
+        assert len(fake.delivered) == len(notices)
+        seconds = max(fake.delivered.values()) - start
+        waits = sorted(fake.delivered[i] - start - at for i, (at, _, _) in enumerate(notices))
+        results.append((label, fake, seconds, waits, posting))
+
+    print(f"{args.notices:,} notices for {args.users:,} users over {args.spread:g}s; limits {args.global_rate:g}/s global, "
+          f"{args.route_limit} per {args.route_window:g}s per channel, {args.latency:g}ms per request")
+    print(f"{'':<24}{'seconds':>9}{'notices/s':>11}{'requests':>10}{'429s':>7}{'p50 wait':>10}{'p99 wait':>10}")
+    for label, fake, seconds, waits, posting in results:
+        print(f"{label:<24}{seconds:>9.1f}{len(waits) / seconds:>11.1f}{fake.requests:>10,}{fake.limited:>7,}"
+              f"{waits[len(waits) // 2]:>9.2f}s{waits[len(waits) * 99 // 100]:>9.2f}s")
+        if posting is not None:
+            print(f"post() for all {args.notices:,} notices: {posting * 1000:.1f}ms ({posting / args.notices * 1e6:.2f}µs each)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notices", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--spread", type=float, default=10, help="seconds the notices arrive over, 0 for all at once")
+    parser.add_argument("--global-rate", type=float, default=50)
+    parser.add_argument("--route-limit", type=int, default=5)
+    parser.add_argument("--route-window", type=float, default=5)
+    parser.add_argument("--latency", type=float, default=20, help="ms the fake endpoint takes per request")
+    parser.add_argument("--concurrency", type=int, default=50, help="requests in flight without the outbox")
+    parser.add_argument("--workers", type=int, default=4, help="outbox delivery tasks")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
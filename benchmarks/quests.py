@@ -0,0 +1,80 @@
+# What daily quests cost: recording an event on a user, and the daily
+# reset. The reset is compared with the full scan it replaces, which
+# clears every user's quest state at midnight and so dirties (and
+# rewrites) the whole economy once a day. Runs against a real store in a
+# throwaway data directory.
+#
+#   python benchmarks/quests.py --users 200000
+
+import argparse, asyncio, os, random, shutil, sys, tempfile, time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from commands import populate
+from quests import QuestBoard, TEMPLATES, WORK
+from storage import open_store
+
+
+async def run(args, volume):
+    board = QuestBoard(per_day=len(TEMPLATES))  # every event counts
+    day = board.day()
+    yesterday = (day - 1) * 86400 + 3600
+    store = open_store(os.path.join(volume, "economy.json"), args.storage, flush_interval=3600,
+                       flush_threshold=10**9)
+    await store.load()
+    store.data.update(populate(args.users, 50, ["bitcoin", "ethereum"], random.Random(args.seed)))
+    for user in store.data.values():
+        board.record(user, WORK, now=yesterday)
+    store.dirty.update(store.data)
+    await store.flush()
+
+    user = next(iter(store.data.values())).copy()
+    start = time.perf_counter()
+    for _ in range(args.events):
+        board.record(user, WORK)
+    per_event = (time.perf_counter() - start) / args.events
+    idle = QuestBoard(per_day=1, templates=[t for t in TEMPLATES if t[0] != WORK])
+    start = time.perf_counter()
+    for _ in range(args.events):
+        idle.record(user, WORK)
+    per_idle = (time.perf_counter() - start) / args.events
+    print(f"{args.users:,} users ({args.storage})")
+    print(f"record an event: {per_event * 1e6:.2f}µs counted, {per_idle * 1e6:.2f}µs when no quest today counts it")
+
+    # The reset itself. Lazily there is nothing to do: yesterday's state
+    # reads as no progress until each user's next event replaces it.
+    start = time.perf_counter()
+    stale = sum(1 for u in store.data.values() if board.progress(u, day) != u.quest_progress)
+    check = time.perf_counter() - start
+    print(f"lazy reset:      0 users written at the reset ({stale:,} now read as reset, "
+          f"{check / args.users * 1e9:.0f}ns each to read)")
+
+    start = time.perf_counter()
+    async with store.transaction(*store.data) as users:
+        for u in users:
+            u.quest_day, u.quest_progress = 0, ()
+    scan = time.perf_counter() - start
+    dirty = len(store.dirty)
+    start = time.perf_counter()
+    await store.flush()
+    flush = time.perf_counter() - start
+    print(f"full-scan reset: {dirty:,} users written, {scan:.2f}s resetting + {flush:.2f}s flushing, every day")
+    store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--storage", default="json", choices=["json", "journal", "sqlite"])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    volume = tempfile.mkdtemp(prefix="economy-quests-")
+    try:
+        asyncio.run(run(args, volume))
+    finally:
+        shutil.rmtree(volume)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# Stored size and load time of the economy for a guild where most members
+# never play. A few players use /daily, /work and /coinflip; everyone else
+# only ever shows up as the target of /balance @member or of a /rob that
+# fails. The real command callbacks run offline against a throwaway data
+# directory, and what the store persists is compared with what the old
+# behaviour stored: a full record for every id a command ever saw.
+#
+#   python benchmarks/sparse.py --members 200000 --players 0.05
+
+import argparse, asyncio, os, random, shutil, sys, tempfile, time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from commands import Interaction, Member
+
+GUILD = 1
+
+
+async def play(main, args, rng):
+    players = max(1, int(args.members * args.players))
+    lookups = 0
+    for uid in range(1, players + 1):
+        for name, kwargs in (("daily", {}), ("work", {}), ("coinflip", {"bet": 50, "choice": "heads"})):
+            await main.tree.get_command(name).callback(Interaction(uid, GUILD), **kwargs)
+    # Every member gets looked up; some get a rob attempt that fails
+    # (the robber is on cooldown), like most rob attempts do.
+    for target in range(1, args.members + 1):
+        source = rng.randint(1, players)
+        await main.tree.get_command("balance").callback(Interaction(source, GUILD), member=Member(target))
+        lookups += 1
+        if target > players and rng.random() < args.robbed:
+            async with main.store.transaction(str(source)) as user:
+                user.cooldowns["rob"] = main.now_ts()
+            await main.tree.get_command("rob").callback(Interaction(source, GUILD), member=Member(target))
+            lookups += 1
+    await main.store.flush()
+    return players, lookups
+
+
+def measure(main, path, mode):
+    # (bytes stored, seconds to load into a store, records stored)
+    from storage import open_backend, open_store
+    size = sum(os.path.getsize(p) for p in (path, path + ".journal", os.path.splitext(path)[0] + ".db") if os.path.exists(p))
+    backend = open_backend(path, mode)
+    users = len(backend.load())
+    backend.close()
+    store = open_store(path, mode)
+    start = time.perf_counter()
+    asyncio.run(store.load())
+    seconds = time.perf_counter() - start
+    store.close()
+    return size, seconds, users
+
+
+def write_legacy(main, path, mode, members):
+    # What the old code stored for the same session: every id it saw got a
+    # full record.
+    from backup import import_records
+    from models import DEFAULT_RECORD
+    records = dict((uid, dict(DEFAULT_RECORD)) for uid in map(str, range(1, members + 1)))
+    for uid, user in main.store.data.items():
+        records[uid] = {**DEFAULT_RECORD, **user.to_dict()}
+    import_records(iter(records.items()), path, mode)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=200_000)
+    parser.add_argument("--players", type=float, default=0.05, help="fraction of members who play")
+    parser.add_argument("--robbed", type=float, default=0.1, help="fraction of non-players targeted by a failed /rob")
+    parser.add_argument("--storage", default="json", choices=["json", "journal", "sqlite"])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    volume = tempfile.mkdtemp(prefix="economy-sparse-")
+    os.environ.update({"VOLUME_PATH": volume, "STORAGE_MODE": args.storage, "FLUSH_INTERVAL": "3600",
+                       "FLUSH_THRESHOLD": "1000000000"})
+    import main as bot
+    try:
+        async def session():
+            await bot.store.load()
+            return await play(bot, args, random.Random(args.seed))
+
+        random.seed(args.seed)
+        players, lookups = asyncio.run(session())
+        bot.store.close()
+        legacy = os.path.join(volume, "legacy", "economy.json")
+        os.makedirs(os.path.dirname(legacy))
+        write_legacy(bot, legacy, args.storage, args.members)
+
+        print(f"{args.members:,} members, {players:,} players, {lookups:,} lookups of members ({args.storage})")
+        print(f"{'':<24}{'stored users':>13}{'size MB':>9}{'load s':>8}")
+        for label, path in (("full records (before)", legacy), ("sparse (after)", bot.DATA_FILE)):
+            size, seconds, users = measure(bot, path, args.storage)
+            print(f"{label:<24}{users:>13,}{size / 1e6:>9.2f}{seconds:>8.2f}")
+        # Loading an old file drops the untouched records once; the next
+        # flush writes what is left.
+        from storage import open_store
+        store = open_store(legacy, args.storage)
+        asyncio.run(store.load())
+        asyncio.run(store.flush())
+        store.close()
+        size, seconds, users = measure(bot, legacy, args.storage)
+        print(f"{'before, after one flush':<24}{users:>13,}{size / 1e6:>9.2f}{seconds:>8.2f}")
+    finally:
+        shutil.rmtree(volume)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# Time from process start to serving interactions, offline: each scenario
+# runs in a fresh process that imports main, runs setup_hook and on_ready
+# with the REST call behind tree.sync() replaced by a fixed delay, then
+# simulates reconnects by firing on_ready again.
+#
+#   first start   no commands.sha256 yet, so the commands are synced
+#   restart       same commands, sync skipped
+#   changed       a command's description changed, synced again
+#
+#   python benchmarks/startup.py --users 100000 --sync-latency 1.5
+
+import argparse, asyncio, json, os, shutil, subprocess, sys, tempfile, time
+
+STARTED = time.perf_counter()
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+
+class FakeBotUser:
+    id = 1
+
+    def __str__(self):
+        return "bench#0000"
+
+
+async def run_scenario(args):
+    import main
+    syncs = []
+
+    async def bulk_upsert_global_commands(application_id, payload):
+        syncs.append(len(payload))
+        await asyncio.sleep(args.sync_latency)
+        return []
+
+    main.tree._http.bulk_upsert_global_commands = bulk_upsert_global_commands
+    main.bot._connection.application_id = 1
+    main.bot._connection.user = FakeBotUser()
+    if args.scenario == "changed":
+        main.tree.get_command("balance").description = "Check your balance (updated)"
+    imported = time.perf_counter() - STARTED
+
+    await main.bot.setup_hook()
+    await main.on_ready()
+    ready = time.perf_counter() - STARTED
+    reconnects = []
+    for _ in range(args.reconnects):
+        start = time.perf_counter()
+        await main.on_ready()
+        reconnects.append(time.perf_counter() - start)
+    for loop in (main.market_tick, main.cooldown_tick, main.flush_economy):
+        loop.cancel()
+    main.loop_lag.stop()
+    return {"import": imported, "ready": ready, "syncs": len(syncs),
+            "reconnect": max(reconnects) if reconnects else 0.0}
+
+
+def populate(path, users):
+    records = {str(i): {"bal": i % 50_000, "lvl": 1 + i % 20, "guilds": [1 + i % 50]} for i in range(1, users + 1)}
+    with open(path, "w") as f:
+        json.dump(records, f)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--sync-latency", type=float, default=1.0, help="seconds a global command sync takes")
+    parser.add_argument("--reconnects", type=int, default=3)
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        result = asyncio.run(run_scenario(args))
+        print(json.dumps(result))
+        return
+
+    volume = tempfile.mkdtemp(prefix="economy-startup-")
+    try:
+        populate(os.path.join(volume, "economy.json"), args.users)
+        env = dict(os.environ, VOLUME_PATH=volume, STORAGE_MODE="json")
+        print(f"{args.users:,} users, sync takes {args.sync_latency}s")
+        print(f"{'scenario':<14}{'import s':>9}{'ready s':>9}{'syncs':>7}{'reconnect ms':>14}")
+        for scenario in ("first start", "restart", "changed"):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--scenario", scenario] + sys.argv[1:],
+                env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"{scenario:<14}{r['import']:>9.2f}{r['ready']:>9.2f}{r['syncs']:>7}{r['reconnect'] * 1000:>14.2f}")
+    finally:
+        shutil.rmtree(volume)
+
+
+if __name__ == "__main__":
+    main()
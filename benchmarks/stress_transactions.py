@@ -0,0 +1,172 @@
+# Fires thousands of concurrent /rob, /coinflip and /buy commands (the real
+# callbacks on main.tree, called with the fakes from commands.py) while the
+# market ticks and fills the orders, and checks that no update is lost:
+# every user must end up with exactly what their own transactions added up
+# to, so the coins in the economy are what they started at plus whatever
+# the commands paid out or took. Commits yield to the event loop before
+# they land, the way a write-through or a partitioned store's do, so
+# unsafe interleavings actually happen.
+#
+#   python benchmarks/stress_transactions.py --users 200 --commands 20000
+#   python benchmarks/stress_transactions.py --no-locks   # shows lost updates
+
+import argparse, asyncio, itertools, math, os, random, shutil, sys, tempfile, time
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from commands import Interaction, command_args, populate, parse_mix
+
+MIX = "rob=4,coinflip=4,buy=2"
+
+
+class Ledger:
+    # What each commit changed, from its own working copies against the
+    # records it checked out. Summed per user, that's what the store has to
+    # end up with unless one commit overwrote another's.
+
+    def __init__(self, store):
+        self.bal = {}
+        self.inv = {}
+        self.bases = {}
+        self.commits = 0
+        checkout, commit = store.checkout, store.commit
+
+        def checkout_wrapper(uids):
+            working = checkout(uids)
+            self.bases[id(working)] = {uid: (user.bal, dict(user.inv)) for uid, user in working.items()}
+            return working
+
+        async def commit_wrapper(working):
+            base = self.bases.pop(id(working))
+            for uid, user in working.items():
+                bal, inv = base[uid]
+                self.bal[uid] = self.bal.get(uid, 0) + user.bal - bal
+                held = self.inv.setdefault(uid, {})
+                for asset in set(inv) | set(user.inv):
+                    held[asset] = held.get(asset, 0) + user.inv.get(asset, 0) - inv.get(asset, 0)
+            self.commits += 1
+            await asyncio.sleep(0)
+            await commit(working)
+
+        store.checkout, store.commit = checkout_wrapper, commit_wrapper
+
+
+@asynccontextmanager
+async def no_lock(*uids):
+    yield
+
+
+async def parallel_check(store, n, delay):
+    # n transactions on n different users, each holding its lock for delay
+    # seconds, should take about delay in total, not n * delay.
+    async def hold(uid):
+        async with store.transaction(uid):
+            await asyncio.sleep(delay)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(hold(f"p{i}") for i in range(n)))
+    return time.perf_counter() - start
+
+
+async def run(args, main):
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    store = main.store
+    cryptos = main.market.names
+    await store.load()
+    store.data.update(populate(args.users, 1, cryptos, rng))
+    main.leaderboards.build(store.data, main.market.prices)
+    main.cooldowns.build(store.data)
+    main.aggregates.build(store.data)
+    start_bal = {uid: user.bal for uid, user in store.data.items()}
+    start_inv = {uid: dict(user.inv) for uid, user in store.data.items()}
+
+    # Each command sees a clock an hour on from the last, so /rob is never
+    # on cooldown and every robbery actually happens.
+    clock = itertools.count(main.now_ts(), 3600)
+    main.now_ts = lambda: next(clock)
+    ledger = Ledger(store)
+    if args.no_locks:
+        store.lock = no_lock
+
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    callbacks = {name: main.tree.get_command(name).callback for name in names}
+    counts = dict.fromkeys(names, 0)
+    errors = {}
+    remaining = [args.commands]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            name = rng.choices(names, weights)[0]
+            interaction = Interaction(rng.randint(1, args.users), 1)
+            try:
+                await callbacks[name](interaction, **command_args(name, rng, args.users, cryptos))
+                counts[name] += 1
+            except Exception as e:
+                errors[f"{name}: {type(e).__name__}: {e}"] = errors.get(f"{name}: {type(e).__name__}: {e}", 0) + 1
+
+    async def ticker():
+        while True:
+            await main.market_tick()
+            await asyncio.sleep(args.tick / 1000)
+
+    ticks = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.wait_for(asyncio.gather(*(worker() for _ in range(args.concurrency))), timeout=300)
+    elapsed = time.perf_counter() - start
+    ticks.cancel()
+
+    lost = 0
+    for uid in start_bal:
+        user = store.get(uid)
+        inv = dict(start_inv[uid])
+        for asset, change in ledger.inv.get(uid, {}).items():
+            inv[asset] = inv.get(asset, 0) + change
+        inv = {asset: units for asset, units in inv.items() if units}
+        if not math.isclose(user.bal, start_bal[uid] + ledger.bal.get(uid, 0), rel_tol=1e-9, abs_tol=1e-6) or user.inv != inv:
+            lost += 1
+    expected = sum(start_bal.values()) + sum(ledger.bal.values())
+    total = sum(store.get(uid).bal for uid in start_bal)
+    print(f"{args.commands} concurrent commands over {args.users} users in {elapsed:.2f}s "
+          f"({args.commands / elapsed:,.0f}/s, {ledger.commits} commits): "
+          + ", ".join(f"{name} {count}" for name, count in counts.items()))
+    print(f"total coins: expected {expected:,.2f}, got {total:,.2f}; users with a lost update: {lost}")
+    print(f"lock table entries left: {len(store.locks)}")
+    for error, count in errors.items():
+        print(f"error x{count}: {error}")
+
+    if not args.no_locks:
+        delay = 0.05
+        took = await parallel_check(store, 200, delay)
+        print(f"200 transactions on distinct users holding their lock {delay * 1000:.0f}ms each: {took * 1000:.0f}ms")
+
+    return math.isclose(total, expected, rel_tol=1e-9, abs_tol=1e-6) and not lost and not errors and not store.locks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--commands", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--mix", default=MIX, help="command=weight,...")
+    parser.add_argument("--tick", type=float, default=5, help="ms between market ticks")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-locks", action="store_true")
+    args = parser.parse_args()
+
+    volume = tempfile.mkdtemp(prefix="economy-stress-")
+    os.environ.update({"VOLUME_PATH": volume, "STORAGE_MODE": "json", "FLUSH_INTERVAL": "30"})
+    import main as bot
+    try:
+        ok = asyncio.run(run(args, bot))
+    finally:
+        bot.store.close()
+        shutil.rmtree(volume)
+    print("✅ no update lost" if ok else "❌ updates lost")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Compares the old dict-with-ISO-strings user records against models.User:
+# resident memory per user and the cost of a cooldown check.
+#
+#   python benchmarks/user_model.py --users 1000000
+
+import argparse, gc, json, os, random, sys, time, tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from models import User
+
+
+def legacy_record(rng, now):
+    last = (now - timedelta(seconds=rng.randint(0, 7200))).isoformat()
+    return {
+        "bal": rng.randint(0, 100_000),
+        "exp": rng.randint(0, 999),
+        "lvl": rng.randint(1, 20),
+        "daily": last,
+        "work": last,
+        "inv": {"dogecoin": rng.randint(1, 500)},
+        "achievements": ["first_daily", "first_work"],
+        "job": "miner",
+        "job_lvl": 1,
+        "job_exp": 0,
+        "boosters": {},
+        "cooldowns": {"rob": last},
+        "daily_quests": {"claimed": False, "quests": []},
+        "investments": {},
+    }
+
+
+def bytes_per_user(factory, n):
+    gc.collect()
+    tracemalloc.start()
+    users = factory(n)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del users
+    return size / n
+
+
+def legacy_cooldown_check(users, now):
+    ready = 0
+    for user in users.values():
+        last = user["cooldowns"].get("rob")
+        if not last or (now - datetime.fromisoformat(last)).total_seconds() >= 3600:
+            ready += 1
+    return ready
+
+
+def model_cooldown_check(users, now):
+    now = int(now.replace(tzinfo=timezone.utc).timestamp())
+    ready = 0
+    for user in users.values():
+        last = user.cooldowns.get("rob", 0)
+        if not last or last + 3600 <= now:
+            ready += 1
+    return ready
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--memory-sample", type=int, default=50_000,
+                        help="users built under tracemalloc to measure bytes per user")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    n = args.users
+    now = datetime.utcnow()
+    rng = random.Random(args.seed)
+
+    legacy, legacy_build = timed(lambda: {str(i): legacy_record(rng, now) for i in range(n)})
+    legacy_ready, legacy_time = timed(legacy_cooldown_check, legacy, now)
+    models, model_build = timed(lambda: {uid: User.from_dict(record) for uid, record in legacy.items()})
+    model_ready, model_time = timed(model_cooldown_check, models, now)
+
+    sample = list(legacy.values())[:args.memory_sample]
+    del legacy, models
+    encoded = json.dumps(sample)
+    legacy_bytes = bytes_per_user(lambda k: json.loads(encoded), len(sample))
+    model_bytes = bytes_per_user(lambda k: [User.from_dict(r) for r in sample[:k]], len(sample))
+
+    print(f"{n:,} users (memory measured on {len(sample):,})")
+    print(f"{'':<22}{'bytes/user':>12}{'build':>10}{'cooldown scan':>16}{'per check':>12}")
+    print(f"{'dict + ISO strings':<22}{legacy_bytes:>12.0f}{legacy_build:>9.2f}s{legacy_time:>15.2f}s"
+          f"{legacy_time / n * 1e9:>10.0f}ns")
+    print(f"{'User (__slots__)':<22}{model_bytes:>12.0f}{model_build:>9.2f}s{model_time:>15.2f}s"
+          f"{model_time / n * 1e9:>10.0f}ns")
+    print(f"users off cooldown: {legacy_ready:,} (legacy) vs {model_ready:,} (model)")
+
+
+if __name__ == "__main__":
+    main()
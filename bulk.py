@@ -0,0 +1,148 @@
+# Server-wide admin actions (/bulk): /addmoney, /removemoney,
+# /resetcooldowns or /resetuser applied to a role, a list of members or
+# everyone with economy data in the server. The whole batch takes its
+# users' locks once, works on copies of their records and goes to the
+# store in a single commit, so an event covering 100k users is one flush
+# rather than 100k of them. A dry run reports the same summary without
+# locking or changing anything.
+
+import asyncio, re
+from achievements import engine as achievements, BALANCE
+
+ADD = "addmoney"
+REMOVE = "removemoney"
+COOLDOWNS = "resetcooldowns"
+RESET = "resetuser"
+ACTIONS = {
+    ADD: "Add money",
+    REMOVE: "Remove money",
+    COOLDOWNS: "Reset cooldowns",
+    RESET: "Reset user data",
+}
+CHUNK = 5000  # users between progress reports (and chances for other commands to run)
+FIELDS = ("users", "created", "skipped", "coins", "cooldowns", "deleted", "rewards")
+
+MENTION = re.compile(r"\d{15,20}")
+
+
+def parse_members(text):
+    # User ids from "<@123> <@!456> 789, ..." in the order given.
+    return list(dict.fromkeys(MENTION.findall(text or "")))
+
+
+def members_in(data, guild):
+    # Everyone with economy data who has played in the guild.
+    return [uid for uid, user in data.items() if guild in user.guilds]
+
+
+def merge_summaries(parts):
+    total = dict.fromkeys(FIELDS, 0)
+    for part in parts:
+        for key in FIELDS:
+            total[key] += part[key]
+    return total
+
+
+def tally(summary, action, user, amount):
+    # What the action will do to user (None for a user with no record yet).
+    if user is None:
+        summary["created"] += 1
+        return
+    if action == ADD:
+        summary["coins"] += amount
+    elif action == REMOVE:
+        summary["coins"] += min(user.bal, amount)
+    elif action == COOLDOWNS:
+        summary["cooldowns"] += len(user.cooldowns)
+    else:
+        summary["deleted"] += 1
+
+
+def apply(action, user, amount, guild):
+    # Changes a working copy; returns the achievement rewards it paid out.
+    if guild and guild not in user.guilds:
+        user.guilds = user.guilds + (guild,)
+    if action == COOLDOWNS:
+        user.cooldowns = {}
+        return 0
+    if action == ADD:
+        user.bal += amount
+    else:
+        user.bal = max(0, user.bal - amount)
+    return sum(reward for _, _, reward in achievements.evaluate(user, BALANCE))
+
+
+async def apply_bulk(store, action, uids, amount=0, guild=None, dry_run=False, progress=None):
+    # Runs the action over uids on store (an EconomyStore) and returns the
+    # summary, a dict of FIELDS. Only /addmoney creates missing users; the
+    # others skip them. progress, if given, is awaited with (done, total)
+    # after every CHUNK users.
+    uids = list(dict.fromkeys(uids))
+    summary = dict.fromkeys(FIELDS, 0)
+    if dry_run:
+        targets = known(store, action, uids, summary)
+        for start in range(0, len(targets), CHUNK):
+            for uid in targets[start:start + CHUNK]:
+                tally(summary, action, store.data.get(uid), amount)
+            await report(progress, min(start + CHUNK, len(targets)), len(targets))
+        if action == ADD:
+            summary["coins"] += summary["created"] * amount
+        return summary
+
+    async with store.lock(*uids):
+        # Checked again now that the users are locked: some may have been
+        # deleted (or created) while we waited.
+        targets = known(store, action, uids, summary)
+        if action == RESET:
+            working = dict.fromkeys(targets)
+            summary["deleted"] = len(working)
+        else:
+            working = {}
+            for start in range(0, len(targets), CHUNK):
+                part = targets[start:start + CHUNK]
+                for uid in part:
+                    tally(summary, action, store.data.get(uid), amount)
+                working.update(store.checkout(part))
+                for uid in part:
+                    summary["rewards"] += apply(action, working[uid], amount, guild)
+                await report(progress, min(start + CHUNK, len(targets)), len(targets))
+            if action == ADD:
+                summary["coins"] += summary["created"] * amount
+        await store.commit(working)
+    return summary
+
+
+def known(store, action, uids, summary):
+    targets = uids if action == ADD else [uid for uid in uids if uid in store.data]
+    summary["users"] = len(targets)
+    summary["skipped"] = len(uids) - len(targets)
+    return targets
+
+
+async def report(progress, done, total):
+    # Always yields: the progress callback only edits the message now and
+    # then, and otherwise returns without giving up the event loop.
+    if progress is not None:
+        await progress(done, total)
+    await asyncio.sleep(0)
+
+
+def describe_bulk(action, summary, amount, dry_run):
+    would = "Dry run: would " if dry_run else ""
+    users = summary["users"]
+    if action == ADD:
+        line = f"{'add' if dry_run else 'Added'} {amount:,} coins to {users:,} users"
+        if summary["created"]:
+            line += f" ({summary['created']:,} of them new)"
+    elif action == REMOVE:
+        line = f"{'remove' if dry_run else 'Removed'} {summary['coins']:,.2f} coins from {users:,} users"
+    elif action == COOLDOWNS:
+        line = f"{'clear' if dry_run else 'Cleared'} {summary['cooldowns']:,} cooldowns of {users:,} users"
+    else:
+        line = f"{'delete' if dry_run else 'Deleted'} the data of {summary['deleted']:,} users"
+    lines = [would + line + "."]
+    if summary["skipped"]:
+        lines.append(f"Skipped {summary['skipped']:,} members with no economy data.")
+    if summary["rewards"]:
+        lines.append(f"Achievement rewards paid: {summary['rewards']:,} coins.")
+    return "\n".join(lines)
@@ -0,0 +1,504 @@
+# Running the bot as several worker processes. Each worker runs an
+# AutoShardedClient for its share of the gateway shards and owns one
+# partition of the economy: the users whose id hashes to it, kept in its own
+# data file. An interaction arrives at whichever worker holds the guild's
+# shard, so commands regularly touch users owned by another worker; those
+# go through the owner (see PartitionedStore).
+#
+# The coordinator (this file run as a script) stands in for a broker: it
+# spawns the workers, tells each where the others listen once all of them
+# have registered, and takes the cluster down if a worker crashes so the
+# process manager restarts it whole. Workers then talk to each other
+# directly over localhost TCP, one JSON message per line.
+#
+#   python cluster.py --workers 4 --shards 8
+#   python cluster.py split --workers 4                  # economy.json -> 4 partitions
+#   python cluster.py split --workers 8 --from-workers 4 # re-partition
+
+import argparse, asyncio, itertools, json, os, signal, sys, zlib
+from contextlib import AsyncExitStack, asynccontextmanager
+from models import User
+from storage import open_backend, backend_path
+
+
+def owner_of(uid, workers):
+    # crc32 rather than hash(): it has to agree between processes.
+    return zlib.crc32(str(uid).encode()) % workers
+
+
+def partition_file(data_file, worker, workers):
+    # economy.json -> economy.2of4.json (economy.2of4.db with SQLite)
+    root, ext = os.path.splitext(data_file)
+    return f"{root}.{worker}of{workers}{ext}"
+
+
+def shards_for(worker, workers, shard_count):
+    return list(range(worker, shard_count, workers))
+
+
+class RemoteError(Exception):
+    pass
+
+
+class Connection:
+    # One link between two processes. Either side can send requests
+    # ({"id", "method", "params"}), notifications (no id) and replies
+    # ({"id", "result"} or {"id", "error"}). Each incoming request runs in
+    # its own task, so a handler waiting for a user lock doesn't hold up
+    # the rest of the link.
+
+    def __init__(self, reader, writer, handlers):
+        self.reader = reader
+        self.writer = writer
+        self.handlers = handlers
+        self.pending = {}
+        self.ids = itertools.count()
+        self.tasks = set()
+        self.reader_task = asyncio.get_running_loop().create_task(self.serve())
+
+    def send(self, message):
+        self.writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+
+    async def call(self, method, **params):
+        id = next(self.ids)
+        future = self.pending[id] = asyncio.get_running_loop().create_future()
+        self.send({"id": id, "method": method, "params": params})
+        try:
+            return await future
+        finally:
+            self.pending.pop(id, None)
+
+    def notify(self, method, **params):
+        self.send({"method": method, "params": params})
+
+    async def serve(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if "method" in message:
+                    task = asyncio.get_running_loop().create_task(self.handle(message))
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+                    continue
+                future = self.pending.get(message["id"])
+                if future is None or future.done():
+                    continue
+                if "error" in message:
+                    future.set_exception(RemoteError(message["error"]))
+                else:
+                    future.set_result(message.get("result"))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("peer went away"))
+
+    async def handle(self, message):
+        try:
+            result = await self.handlers[message["method"]](**message.get("params", {}))
+        except Exception as e:
+            if "id" in message:
+                self.send({"id": message["id"], "error": f"{type(e).__name__}: {e}"})
+            else:
+                print(f"❌ {message['method']} from a peer failed: {e}")
+            return
+        if "id" in message:
+            self.send({"id": message["id"], "result": result})
+
+    def close(self):
+        self.reader_task.cancel()
+        self.writer.close()
+
+
+class ClusterNode:
+    # This worker's view of the cluster. handlers maps method names to
+    # async functions taking keyword arguments and returning something
+    # JSON can carry; call() runs them on any worker, this one included.
+
+    def __init__(self, worker, workers, coordinator):
+        self.worker = worker
+        self.workers = workers
+        self.coordinator = coordinator  # (host, port)
+        self.handlers = {}
+        self.peers = {}  # worker -> Connection used for our requests
+        self.incoming = set()
+        self.server = None
+        self.control = None
+
+    @classmethod
+    def from_env(cls):
+        # Set by the coordinator; None when the bot runs on its own.
+        if "WORKER_ID" not in os.environ:
+            return None
+        host, _, port = os.getenv("COORDINATOR", "127.0.0.1:7800").rpartition(":")
+        return cls(int(os.environ["WORKER_ID"]), int(os.environ["WORKER_COUNT"]), (host, int(port)))
+
+    def owner(self, uid):
+        return owner_of(uid, self.workers)
+
+    def owns(self, uid):
+        return self.owner(uid) == self.worker
+
+    async def start(self):
+        # Registers with the coordinator and connects to every peer; returns
+        # once the whole cluster is reachable.
+        self.server = await asyncio.start_server(self.accept, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection(*self.coordinator)
+        self.control = Connection(reader, writer, self.handlers)
+        addresses = await self.control.call("register", worker=self.worker, port=port)
+        for worker, (host, port) in addresses.items():
+            if int(worker) != self.worker:
+                reader, writer = await asyncio.open_connection(host, port)
+                self.peers[int(worker)] = Connection(reader, writer, self.handlers)
+
+    async def accept(self, reader, writer):
+        self.incoming.add(Connection(reader, writer, self.handlers))
+
+    async def barrier(self, name):
+        # Waits until every worker has reached the barrier of this name.
+        await self.control.call("barrier", name=name)
+
+    async def call(self, worker, method, **params):
+        if worker == self.worker:
+            return await self.handlers[method](**params)
+        return await self.peers[worker].call(method, **params)
+
+    async def call_all(self, method, **params):
+        return await asyncio.gather(*(self.call(worker, method, **params) for worker in range(self.workers)))
+
+    def notify(self, worker, method, **params):
+        self.peers[worker].notify(method, **params)
+
+    def broadcast(self, method, **params):
+        for connection in self.peers.values():
+            connection.notify(method, **params)
+
+    def close(self):
+        for connection in itertools.chain(self.peers.values(), self.incoming, [self.control] if self.control else []):
+            connection.close()
+        if self.server:
+            self.server.close()
+
+
+class PartitionedStore:
+    # The EconomyStore interface main.py uses, over users spread across the
+    # workers. Users this worker owns live in `local`, a normal EconomyStore
+    # with its own data file, listeners and flushes; anything else is asked
+    # of the owner.
+    #
+    # A transaction locks its users in global sorted uid order, one owner's
+    # run of users at a time, so two workers robbing each other's users
+    # can't deadlock. A remote owner keeps its users locked until the
+    # transaction ends and applies it through its own store, so its
+    # listeners (leaderboards, timers) and flushes see the change like any
+    # local one.
+    #
+    # Ending it takes two phases. First every remote owner is sent its new
+    # records ("prepare"): it checks its hold is still live, stages them
+    # and from then on keeps the lock until told what to do. If any owner
+    # has already given up (its hold passed HOLD_TIMEOUT, or the link
+    # dropped) the others are told to abort and nothing changes. Only when
+    # all have prepared is anything applied: here first, then "end" tells
+    # the remote owners to apply what they staged. A prepared owner that
+    # hears nothing for PREPARED_TIMEOUT drops the transaction; that only
+    # happens if this worker dies between the two phases.
+
+    HOLD_TIMEOUT = 10
+    PREPARED_TIMEOUT = 60
+
+    def __init__(self, local, node):
+        self.local = local
+        self.node = node
+        self.held = {}  # txn id -> (future for the staged records, future for the outcome, future for it being applied)
+        self.txn_ids = itertools.count()
+        node.handlers.update(begin=self.serve_begin, prepare=self.serve_prepare, end=self.serve_end,
+                             view=self.serve_view, remove=self.serve_remove)
+
+    @property
+    def data(self):
+        return self.local.data
+
+    @property
+    def listeners(self):
+        return self.local.listeners
+
+    @property
+    def metrics(self):
+        return self.local.metrics
+
+    async def load(self):
+        return await self.local.load()
+
+    async def flush(self):
+        return await self.local.flush()
+
+    def close(self):
+        self.local.close()
+
+    def get(self, uid):
+        # Only this worker's users.
+        return self.local.get(uid)
+
+    async def view(self, uid):
+        owner = self.node.owner(uid)
+        if owner == self.node.worker:
+            return await self.local.view(uid)
+        return User.from_dict(await self.node.call(owner, "view", uid=uid))
+
+    async def remove(self, uid):
+        return await self.node.call(self.node.owner(uid), "remove", uid=uid)
+
+    @asynccontextmanager
+    async def transaction(self, *uids):
+        runs = []
+        for uid in sorted(set(uids)):
+            owner = self.node.owner(uid)
+            if runs and runs[-1][0] == owner:
+                runs[-1][1].append(uid)
+            else:
+                runs.append((owner, [uid]))
+        if len(runs) == 1 and runs[0][0] == self.node.worker:
+            async with self.local.transaction(*uids) as records:
+                yield records
+            return
+
+        working = {}
+        local = {}
+        remote = []
+        async with AsyncExitStack() as stack:
+            try:
+                for owner, run in runs:
+                    if owner == self.node.worker:
+                        await stack.enter_async_context(self.local.lock(*run))
+                        local.update(self.local.checkout(run))
+                        working.update(local)
+                        continue
+                    txn = f"{self.node.worker}.{next(self.txn_ids)}"
+                    remote.append((owner, txn, run))
+                    records = await self.node.call(owner, "begin", txn=txn, uids=run)
+                    working.update((uid, User.from_dict(record)) for uid, record in zip(run, records))
+                records = [working[uid] for uid in uids]
+                yield records[0] if len(records) == 1 else records
+                await asyncio.gather(*(
+                    self.node.call(owner, "prepare", txn=txn, records=[working[uid].to_dict() for uid in run])
+                    for owner, txn, run in remote
+                ))
+                if local:
+                    await self.local.commit(local)
+            except BaseException:
+                for owner, txn, _ in remote:
+                    self.node.notify(owner, "end", txn=txn, commit=False)
+                raise
+            await asyncio.gather(*(self.node.call(owner, "end", txn=txn, commit=True) for owner, txn, _ in remote))
+
+    async def serve_begin(self, txn, uids):
+        loop = asyncio.get_running_loop()
+        locked, staged, outcome, applied = (loop.create_future() for _ in range(4))
+        self.held[txn] = (staged, outcome, applied)
+        loop.create_task(self.hold(txn, uids, locked, staged, outcome, applied))
+        return await locked
+
+    async def hold(self, txn, uids, locked, staged, outcome, applied):
+        try:
+            async with self.local.lock(*uids):
+                working = self.local.checkout(uids)
+                locked.set_result([working[uid].to_dict() for uid in uids])
+                try:
+                    records = await asyncio.wait_for(staged, self.HOLD_TIMEOUT)
+                except asyncio.TimeoutError:
+                    print(f"❌ Transaction {txn} timed out, releasing {', '.join(uids)}.")
+                    return
+                if records is None:
+                    return
+                try:
+                    commit = await asyncio.wait_for(outcome, self.PREPARED_TIMEOUT)
+                except asyncio.TimeoutError:
+                    print(f"❌ Transaction {txn} was prepared but never ended, dropping it for {', '.join(uids)}.")
+                    return
+                if not commit:
+                    return
+                try:
+                    await self.local.commit({uid: User.from_dict(record) for uid, record in zip(uids, records)})
+                except Exception as e:
+                    applied.set_exception(e)
+                else:
+                    applied.set_result(True)
+        finally:
+            self.held.pop(txn, None)
+
+    async def serve_prepare(self, txn, records):
+        # Once staged the hold no longer times out on HOLD_TIMEOUT; the
+        # answer means this owner will apply the records if told to.
+        entry = self.held.get(txn)
+        if entry is None or entry[0].done():
+            raise RuntimeError(f"transaction {txn} expired before it was prepared")
+        entry[0].set_result(records)
+        return True
+
+    async def serve_end(self, txn, commit):
+        entry = self.held.get(txn)
+        if entry is not None and not commit and not entry[0].done():
+            entry[0].set_result(None)  # aborted before it was prepared
+            return False
+        if entry is None or not entry[0].done() or entry[0].cancelled() or entry[0].result() is None or entry[1].done():
+            if not commit:
+                return False
+            raise RuntimeError(f"transaction {txn} expired before it committed")
+        staged, outcome, applied = entry
+        outcome.set_result(commit)
+        if not commit:
+            return False
+        return await applied
+
+    async def serve_view(self, uid):
+        return (await self.local.view(uid)).to_dict()
+
+    async def serve_remove(self, uid):
+        return await self.local.remove(uid)
+
+
+### COORDINATOR ###
+
+class Coordinator:
+    # Spawns `workers` copies of command with WORKER_ID, WORKER_COUNT,
+    # SHARD_COUNT, SHARD_IDS and COORDINATOR set, answers their "register"
+    # once all have registered (with every worker's address) and their
+    # "barrier" once all have reached it. A worker exiting non-zero stops
+    # the others (SIGINT, so they flush on the way out); run() returns the
+    # exit codes once every worker is gone.
+
+    STOP_TIMEOUT = 30
+
+    def __init__(self, workers, command, shard_count=None, host="127.0.0.1", port=7800, env=None):
+        self.workers = workers
+        self.command = command
+        self.shard_count = shard_count or workers
+        self.host = host
+        self.port = port
+        self.env = env or {}
+        self.addresses = {}
+        self.barriers = {}
+        self.connections = set()
+        self.processes = []
+
+    async def run(self):
+        server = await asyncio.start_server(self.accept, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: Ctrl+C reaches the workers directly
+        for worker in range(self.workers):
+            env = dict(os.environ, **self.env,
+                       WORKER_ID=str(worker), WORKER_COUNT=str(self.workers),
+                       SHARD_COUNT=str(self.shard_count),
+                       SHARD_IDS=",".join(map(str, shards_for(worker, self.workers, self.shard_count))),
+                       COORDINATOR=f"{self.host}:{self.port}")
+            self.processes.append(await asyncio.create_subprocess_exec(*self.command, env=env))
+        waits = {loop.create_task(process.wait()): process for process in self.processes}
+        pending = set(waits)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if any(task.result() != 0 for task in done):
+                self.stop()
+        server.close()
+        for connection in self.connections:
+            connection.close()
+        return [process.returncode for process in self.processes]
+
+    def stop(self):
+        for process in self.processes:
+            if process.returncode is None:
+                if sys.platform == "win32":
+                    process.terminate()
+                else:
+                    process.send_signal(signal.SIGINT)
+        asyncio.get_running_loop().call_later(self.STOP_TIMEOUT, self.kill)
+
+    def kill(self):
+        for process in self.processes:
+            if process.returncode is None:
+                process.kill()
+
+    async def accept(self, reader, writer):
+        self.connections.add(Connection(reader, writer, {"register": self.register, "barrier": self.barrier}))
+
+    async def register(self, worker, port):
+        self.addresses[worker] = (self.host, port)
+        await self.barrier("register")
+        return {str(w): address for w, address in self.addresses.items()}
+
+    async def barrier(self, name):
+        entry = self.barriers.setdefault(name, [0, asyncio.Event()])
+        entry[0] += 1
+        if entry[0] == self.workers:
+            entry[1].set()
+        await entry[1].wait()
+        return True
+
+
+### PARTITIONING ###
+
+def split(data_file, mode, workers, source_workers=None):
+    # Writes the economy as `workers` partitions, read either from the
+    # single store or from an existing split into source_workers. Returns
+    # the number of users per partition.
+    if source_workers:
+        sources = [partition_file(data_file, k, source_workers) for k in range(source_workers)]
+    else:
+        sources = [data_file]
+    data = {}
+    for path in sources:
+        backend = open_backend(path, mode)
+        data.update(backend.load())
+        backend.close()
+    parts = [{} for _ in range(workers)]
+    for uid, record in data.items():
+        parts[owner_of(uid, workers)][uid] = record
+    for k, part in enumerate(parts):
+        backend = open_backend(partition_file(data_file, k, workers), mode)
+        if backend.load():
+            backend.close()
+            raise SystemExit(f"❌ {backend_path(partition_file(data_file, k, workers), mode)} already has data, refusing to overwrite it.")
+        backend.write(part, set(part))
+        backend.close()
+    return [len(part) for part in parts]
+
+
+def partitioned(data_file, mode, workers):
+    return any(os.path.exists(backend_path(partition_file(data_file, k, workers), mode)) for k in range(workers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot as several worker processes.")
+    parser.add_argument("action", nargs="?", default="run", choices=["run", "split"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shards", type=int, default=None, help="gateway shards in total (default: one per worker)")
+    parser.add_argument("--port", type=int, default=int(os.getenv("COORDINATOR_PORT", "7800")))
+    parser.add_argument("--file", default=os.getenv("VOLUME_PATH", ".") + "/economy.json")
+    parser.add_argument("--storage", default=os.getenv("STORAGE_MODE", "json"))
+    parser.add_argument("--from-workers", type=int, default=None, help="split: re-partition an existing split")
+    args = parser.parse_args()
+
+    if args.action == "split":
+        counts = split(args.file, args.storage, args.workers, args.from_workers)
+        print(f"✅ Split {sum(counts)} users into {args.workers} partitions: {counts}")
+        return
+    if not partitioned(args.file, args.storage, args.workers) and os.path.exists(backend_path(args.file, args.storage)):
+        counts = split(args.file, args.storage, args.workers)
+        print(f"✅ Split {backend_path(args.file, args.storage)} into {args.workers} partitions: {counts}")
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    coordinator = Coordinator(args.workers, [sys.executable, script], args.shards, port=args.port)
+    codes = asyncio.run(coordinator.run())
+    sys.exit(max(codes, key=abs, default=0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# Cooldowns in one place. Each cooldown is registered once with how to read
+# its last use from a user and how long it lasts, and commands ask
+# Cooldowns.remaining() instead of doing the arithmetic themselves.
+#
+# Anything that has to happen when a cooldown or booster runs out (expiring
+# the booster, DMing users who asked to be reminded) is a timer in a
+# hierarchical timing wheel, advanced once a second. The records stay the
+# source of truth: timers are derived from them on every commit (the store
+# listener) and rebuilt from them at startup, so nothing extra is persisted
+# besides the users' reminder opt-ins.
+
+from models import now_ts
+
+BOOSTER = "booster:"  # timer kinds for booster expiry are BOOSTER + name
+
+
+class TimingWheel:
+    # Two wheels with one-second resolution: 256 one-second slots, then
+    # 4096 slots of 256 seconds (about 12 days); anything further out waits
+    # in an overflow bucket that is re-sorted every 2**20 seconds. A timer
+    # sits at the lowest level where it shares every higher digit with the
+    # current time and moves down as the wheel reaches its slot, so
+    # advancing one second costs O(timers due + timers cascading) however
+    # many are pending. Keeping the upper slots 256 seconds wide bounds a
+    # cascade to the timers of the next 256 seconds, rather than moving
+    # most of a day's timers in one tick.
+
+    BITS = (8, 12)
+
+    def __init__(self, now):
+        self.now = now
+        self.shifts = [sum(self.BITS[:level]) for level in range(len(self.BITS))]
+        self.span = sum(self.BITS)
+        self.wheels = [[{} for _ in range(1 << bits)] for bits in self.BITS]
+        self.overflow = {}
+        self.due = {}
+        self.where = {}  # key -> the dict it currently sits in
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, key):
+        return key in self.where
+
+    def schedule(self, key, expires):
+        self.cancel(key)
+        self.place(key, expires)
+
+    def cancel(self, key):
+        slot = self.where.pop(key, None)
+        if slot is not None:
+            del slot[key]
+
+    def place(self, key, expires):
+        if expires <= self.now:
+            slot = self.due
+        else:
+            slot = self.overflow
+            for level, bits in enumerate(self.BITS):
+                top = self.shifts[level] + bits
+                if expires >> top == self.now >> top:
+                    slot = self.wheels[level][(expires >> self.shifts[level]) & ((1 << bits) - 1)]
+                    break
+        slot[key] = expires
+        self.where[key] = slot
+
+    def cascade(self, slot):
+        items = list(slot.items())
+        slot.clear()
+        for key, expires in items:
+            self.place(key, expires)
+
+    def advance(self, now):
+        # Moves the wheel to now and returns [(key, expires)] for every
+        # timer that came due, removing them.
+        while self.now < now:
+            self.now += 1
+            t = self.now
+            if t & ((1 << self.span) - 1) == 0:
+                self.cascade(self.overflow)
+            for level in range(len(self.BITS) - 1, 0, -1):
+                if t & ((1 << self.shifts[level]) - 1) == 0:
+                    self.cascade(self.wheels[level][(t >> self.shifts[level]) & ((1 << self.BITS[level]) - 1)])
+            slot = self.wheels[0][t & ((1 << self.BITS[0]) - 1)]
+            for key in slot:
+                self.where[key] = self.due
+            self.due.update(slot)
+            slot.clear()
+        fired = list(self.due.items())
+        for key, _ in fired:
+            del self.where[key]
+        self.due.clear()
+        return fired
+
+
+class Cooldown:
+    __slots__ = ("name", "last", "duration", "ready")
+
+    def __init__(self, name, last, duration, ready):
+        self.name = name
+        self.last = last          # user -> epoch of last use, 0 if never
+        self.duration = duration  # user -> seconds
+        self.ready = ready        # reminder text
+
+
+class Cooldowns:
+    def __init__(self, now=None):
+        self.kinds = {}
+        self.wheel = TimingWheel(now or now_ts())
+        self.timers = {}  # uid -> {kind: expires} currently in the wheel
+
+    def add(self, name, last, duration, ready):
+        self.kinds[name] = Cooldown(name, last, duration, ready)
+
+    def remaining(self, user, name, now=None):
+        kind = self.kinds[name]
+        last = kind.last(user)
+        if not last:
+            return 0
+        return max(0, last + kind.duration(user) - (now or now_ts()))
+
+    def wanted(self, user, now):
+        # The timers a record calls for: expiry of each booster, and each
+        # cooldown the user wants a reminder for that hasn't run out yet.
+        timers = {BOOSTER + name: expires for name, expires in user.boosters.items()}
+        for name in user.reminders:
+            kind = self.kinds.get(name)
+            if kind is None:
+                continue
+            last = kind.last(user)
+            if last and last + kind.duration(user) > now:
+                timers[name] = last + kind.duration(user)
+        return timers
+
+    def sync(self, uid, user):
+        # Store listener: brings the user's timers in line with the
+        # committed record (None when the user was deleted).
+        wanted = self.wanted(user, self.wheel.now) if user is not None else {}
+        current = self.timers.get(uid, {})
+        if wanted == current:
+            return
+        for kind in current.keys() - wanted.keys():
+            self.wheel.cancel((uid, kind))
+        for kind, expires in wanted.items():
+            if current.get(kind) != expires:
+                self.wheel.schedule((uid, kind), expires)
+        if wanted:
+            self.timers[uid] = wanted
+        else:
+            self.timers.pop(uid, None)
+
+    def build(self, data):
+        for uid, user in data.items():
+            if user.boosters or user.reminders:
+                self.sync(uid, user)
+
+    def advance(self, now=None):
+        # Returns [(uid, kind)] for the timers that ran out.
+        fired = []
+        for (uid, kind), _ in self.wheel.advance(now or now_ts()):
+            timers = self.timers.get(uid)
+            if timers is not None:
+                timers.pop(kind, None)
+                if not timers:
+                    del self.timers[uid]
+            fired.append((uid, kind))
+        return fired
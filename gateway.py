@@ -0,0 +1,72 @@
+# How the bot connects to the gateway and what it keeps of the users it
+# sees.
+#
+# The default is the original configuration: every intent, so discord.py
+# caches every member and presence, chunks every guild on connect and keeps
+# the last 1000 messages. Lean mode asks only for guilds (kept so
+# interaction.user.guild_permissions and guild_id work) and caches no
+# members, no messages and chunks nothing. The economy commands get
+# everything they need from the interaction itself: the invoking user and
+# any discord.Member argument arrive resolved in the payload. What's left
+# is looking users up by id later (reminder DMs), which is what UserCache
+# is for.
+
+from collections import OrderedDict
+import discord
+
+
+def client_options(lean=False):
+    # Keyword arguments for discord.Client / AutoShardedClient.
+    if not lean:
+        return {"intents": discord.Intents.all()}
+    return {
+        "intents": discord.Intents(guilds=True),
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False,
+        "max_messages": None,
+    }
+
+
+class UserCache:
+    # The most recently seen capacity users (interaction participants, and
+    # anyone fetched by id), least recently used dropped first. Holds the
+    # discord.User/Member objects themselves, so a DM needs no REST call
+    # for anyone who used the bot recently.
+
+    def __init__(self, client, capacity=10_000):
+        self.client = client
+        self.capacity = capacity
+        self.users = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.users)
+
+    def remember(self, user):
+        key = str(user.id)
+        self.users[key] = user
+        self.users.move_to_end(key)
+        if len(self.users) > self.capacity:
+            self.users.popitem(last=False)
+
+    def get(self, uid):
+        user = self.users.get(uid)
+        if user is not None:
+            self.users.move_to_end(uid)
+        return user
+
+    def display_name(self, uid, default=None):
+        user = self.get(uid)
+        return user.display_name if user is not None else default
+
+    async def fetch(self, uid):
+        # Cache, then the client's own cache, then the API.
+        user = self.get(uid)
+        if user is not None:
+            self.hits += 1
+            return user
+        self.misses += 1
+        user = self.client.get_user(int(uid)) or await self.client.fetch_user(int(uid))
+        self.remember(user)
+        return user
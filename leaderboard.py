@@ -0,0 +1,394 @@
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+import asyncio
+import numpy as np
+
+METRICS = ("balance", "level", "networth")
+
+
+class RankIndex:
+    # Order-statistics index over integer row ids, highest score first. Most
+    # entries sit in a NumPy "base" sorted by score at the last load(); the
+    # changes since then go into a small sorted overlay. A rank is a
+    # searchsorted on the base plus two bisects on the overlay, and
+    # rebuilding the base (every price tick, or once the overlay outgrows
+    # REBUILD_AFTER) is pure NumPy with no per-entry Python objects.
+
+    REBUILD_AFTER = 50_000
+
+    def __init__(self):
+        self.load(np.empty(0, dtype=np.int64), np.empty(0))
+
+    def __len__(self):
+        return self.count
+
+    def load(self, rows, scores):
+        order = np.argsort(-scores, kind="stable")
+        self.top_rows = rows[order]
+        self.top_neg = -scores[order]
+        by_row = np.argsort(rows)
+        self.lookup_rows = rows[by_row]
+        self.lookup_scores = scores[by_row]
+        self.changed = {}   # row -> current score, None once removed
+        self.over = []      # sorted (-score, row) for changed rows still ranked
+        self.stale = []     # sorted -score of the base entries they replaced
+        self.count = len(rows)
+
+    def base_score(self, row):
+        i = int(np.searchsorted(self.lookup_rows, row))
+        if i < len(self.lookup_rows) and self.lookup_rows[i] == row:
+            return float(self.lookup_scores[i])
+        return None
+
+    def score(self, row):
+        if row in self.changed:
+            return self.changed[row]
+        return self.base_score(row)
+
+    def set(self, row, score):
+        if row in self.changed:
+            old = self.changed[row]
+            if old == score:
+                return
+            if old is not None:
+                self.over.remove((-old, row))
+        else:
+            old = self.base_score(row)
+            if old == score:
+                return
+            if old is not None:
+                insort(self.stale, -old)
+        self.count += (score is not None) - (old is not None)
+        self.changed[row] = score
+        if score is not None:
+            insort(self.over, (-score, row))
+        if len(self.changed) > self.REBUILD_AFTER:
+            self.compact()
+
+    def discard(self, row):
+        self.set(row, None)
+
+    def compact(self):
+        changed = np.fromiter(self.changed, dtype=np.int64, count=len(self.changed))
+        keep = ~np.isin(self.top_rows, changed)
+        rows = np.concatenate([self.top_rows[keep], np.array([row for _, row in self.over], dtype=np.int64)])
+        neg = np.concatenate([self.top_neg[keep], np.array([key for key, _ in self.over], dtype=float)])
+        self.load(rows, -neg)
+
+    def rank(self, row):
+        # 1-based; users with equal scores share a place. None if unranked.
+        score = self.score(row)
+        if score is None:
+            return None
+        return self.count_above(score) + 1
+
+    def count_above(self, score):
+        key = -score
+        above = int(np.searchsorted(self.top_neg, key, side="left"))
+        above -= bisect_left(self.stale, key)
+        above += bisect_left(self.over, (key, -1))
+        return above
+
+    def top(self, n):
+        # Merges the base (skipping rows that changed) with the overlay.
+        result = []
+        i = j = 0
+        while len(result) < n:
+            while i < len(self.top_rows) and int(self.top_rows[i]) in self.changed:
+                i += 1
+            base = (float(self.top_neg[i]), int(self.top_rows[i])) if i < len(self.top_rows) else None
+            over = self.over[j] if j < len(self.over) else None
+            if base is None and over is None:
+                break
+            if over is None or (base is not None and base[0] <= over[0]):
+                result.append((base[1], -base[0]))
+                i += 1
+            else:
+                result.append((over[1], -over[0]))
+                j += 1
+        return result
+
+
+class Leaderboards:
+    # Balance, level and net worth rankings, globally and per guild. Every
+    # committed change updates the boards the user is on. Net worth is
+    # bal + (inv + investments) valued at the current prices; holdings are
+    # mirrored into NumPy arrays (one row per user) so a price tick re-values
+    # everyone with one matrix product and one sort per board instead of a
+    # Python loop over users. On a tick the sorts run in a worker thread
+    # (revalue_in_thread) while commands carry on against the old boards.
+
+    def __init__(self, assets):
+        self.assets = list(assets)
+        self.asset_index = {name: i for i, name in enumerate(self.assets)}
+        self.prices = np.zeros(len(self.assets))
+        self.rows = {}
+        self.free_rows = []
+        self.size = 0
+        self.uid_of = np.empty(0, dtype=object)
+        self.bal = np.zeros(0)
+        self.level = np.zeros(0)
+        self.hold = np.zeros((0, len(self.assets)))
+        self.active = np.zeros(0, dtype=bool)
+        self.user_guilds = {}
+        self.guild_members = {}
+        self.guild_rows = {}
+        self.global_boards = {metric: RankIndex() for metric in METRICS}
+        self.guild_boards = {}
+        self.pending = None  # {uid: user} while inside batch()
+        self.touched = None  # uid -> (row, guilds) before the change, while revalue_in_thread() sorts
+        self.revalues = 0    # networth rebuilds so far
+        self.revaluing = asyncio.Lock()
+
+    def boards(self, guild=None):
+        if guild is None:
+            return self.global_boards
+        if guild not in self.guild_boards:
+            self.guild_boards[guild] = {metric: RankIndex() for metric in METRICS}
+        return self.guild_boards[guild]
+
+    def grow(self, needed):
+        if needed <= len(self.bal):
+            return
+        extra = max(1024, len(self.bal), needed - len(self.bal))
+        self.uid_of = np.concatenate([self.uid_of, np.empty(extra, dtype=object)])
+        self.bal = np.concatenate([self.bal, np.zeros(extra)])
+        self.level = np.concatenate([self.level, np.zeros(extra)])
+        self.hold = np.concatenate([self.hold, np.zeros((extra, len(self.assets)))])
+        self.active = np.concatenate([self.active, np.zeros(extra, dtype=bool)])
+
+    def row_for(self, uid):
+        row = self.rows.get(uid)
+        if row is not None:
+            return row
+        if self.free_rows:
+            row = self.free_rows.pop()
+        else:
+            row = self.size
+            self.size += 1
+            self.grow(self.size)
+        self.uid_of[row] = uid
+        self.rows[uid] = row
+        return row
+
+    def mirror(self, row, user):
+        self.bal[row] = user.bal
+        self.level[row] = user.lvl + user.exp / 1000
+        self.hold[row] = 0.0
+        for bag in (user.inv, user.investments):
+            for name, amount in bag.items():
+                i = self.asset_index.get(name)
+                if i is not None:
+                    self.hold[row, i] += amount
+        self.active[row] = True
+
+    def set_guilds(self, uid, row, guilds):
+        old = self.user_guilds.get(uid, ())
+        if old == guilds:
+            return
+        for guild in set(old) - set(guilds):
+            self.guild_members[guild].discard(uid)
+            self.guild_rows.pop(guild, None)
+            for board in self.boards(guild).values():
+                board.discard(row)
+        for guild in set(guilds) - set(old):
+            self.guild_members.setdefault(guild, set()).add(uid)
+            self.guild_rows.pop(guild, None)
+        if guilds:
+            self.user_guilds[uid] = guilds
+        else:
+            self.user_guilds.pop(uid, None)
+
+    # A batch touching at least 1/REBUILD_SHARE of the users rebuilds the
+    # boards outright; that's cheaper than that many row updates.
+    REBUILD_SHARE = 32
+
+    @contextmanager
+    def batch(self):
+        # For commits of many users at once (settling a market tick): the
+        # updates inside are collected and applied together on exit. A
+        # batch opened while another is running (a tick settling during a
+        # /bulk) just joins it.
+        if self.pending is not None:
+            yield
+            return
+        self.pending = {}
+        try:
+            yield
+        finally:
+            pending, self.pending = self.pending, None
+            if len(pending) * self.REBUILD_SHARE < len(self.rows):
+                for uid, user in pending.items():
+                    self.update(uid, user)
+            else:
+                for uid, user in pending.items():
+                    if user is None:
+                        self.remove(uid)
+                    else:
+                        row = self.row_for(uid)
+                        self.mirror(row, user)
+                        self.set_guilds(uid, row, user.guilds)
+                self.load_boards("balance", self.bal)
+                self.load_boards("level", self.level)
+                self.revalue(self.prices)
+
+    def update(self, uid, user):
+        # Store listener: called with the committed record, or None when the
+        # user was deleted.
+        if self.pending is not None:
+            self.pending[uid] = user
+            return
+        if user is None:
+            self.remove(uid)
+            return
+        self.touch(uid)
+        row = self.row_for(uid)
+        self.mirror(row, user)
+        self.set_guilds(uid, row, user.guilds)
+        scores = {
+            "balance": float(self.bal[row]),
+            "level": float(self.level[row]),
+            "networth": float(self.bal[row] + self.hold[row] @ self.prices),
+        }
+        for guild in (None, *user.guilds):
+            for metric, board in self.boards(guild).items():
+                board.set(row, scores[metric])
+
+    def remove(self, uid):
+        self.touch(uid)
+        row = self.rows.pop(uid, None)
+        if row is None:
+            return
+        self.set_guilds(uid, row, ())
+        for board in self.global_boards.values():
+            board.discard(row)
+        self.active[row] = False
+        self.uid_of[row] = None
+        self.free_rows.append(row)
+
+    def build(self, data, prices):
+        # Bulk load once the store has been loaded: rows are handed out in
+        # order and the arrays filled in one go.
+        uids = list(data)
+        users = list(data.values())
+        n = len(uids)
+        self.grow(n)
+        self.size = n
+        self.rows = dict(zip(uids, range(n)))
+        self.uid_of[:n] = uids
+        self.bal[:n] = [user.bal for user in users]
+        self.level[:n] = [user.lvl + user.exp / 1000 for user in users]
+        self.active[:n] = True
+        guild_rows = {}
+        for row, user in enumerate(users):
+            if user.inv or user.investments:
+                self.mirror(row, user)
+            if user.guilds:
+                self.user_guilds[uids[row]] = user.guilds
+                for guild in user.guilds:
+                    self.guild_members.setdefault(guild, set()).add(uids[row])
+                    guild_rows.setdefault(guild, []).append(row)
+        for guild, rows in guild_rows.items():
+            self.guild_rows[guild] = np.array(rows, dtype=np.int64)
+        self.load_boards("balance", self.bal)
+        self.load_boards("level", self.level)
+        self.revalue(prices)
+
+    def revalue(self, prices):
+        # prices: array in self.assets order, or {asset: price}.
+        if isinstance(prices, dict):
+            prices = [prices.get(name, 0.0) for name in self.assets]
+        self.prices = np.asarray(prices, dtype=float)
+        self.revalues += 1
+        self.load_boards("networth", self.bal + self.hold @ self.prices)
+
+    async def revalue_in_thread(self, prices):
+        # revalue() for a price tick: the net worths are worked out here,
+        # but the sorts (which release the GIL) run in a worker thread and
+        # the finished boards are swapped in afterwards. Users who changed
+        # in the meantime are then put right at the new prices. If the
+        # boards were rebuilt outright meanwhile (a large batch()), this
+        # falls back to revalue().
+        if isinstance(prices, dict):
+            prices = [prices.get(name, 0.0) for name in self.assets]
+        prices = np.asarray(prices, dtype=float)
+        async with self.revaluing:
+            values = self.bal[:self.size] + self.hold[:self.size] @ prices
+            parts = {None: np.flatnonzero(self.active[:self.size])}
+            for guild in self.guild_members:
+                parts[guild] = self.rows_of(guild)
+            started, self.touched = self.revalues, {}
+            try:
+                boards = await asyncio.get_running_loop().run_in_executor(None, sorted_boards, values, parts)
+            except BaseException:
+                self.touched = None
+                raise
+            touched, self.touched = self.touched, None
+            if self.revalues != started:
+                self.revalue(prices)
+                return
+            self.prices = prices
+            self.revalues += 1
+            for guild, board in boards.items():
+                self.boards(guild)["networth"] = board
+            for row, guilds in touched.values():
+                if row is not None:
+                    for guild in (None, *guilds):
+                        self.boards(guild)["networth"].discard(row)
+            for uid in touched:
+                row = self.rows.get(uid)
+                if row is not None:
+                    score = float(self.bal[row] + self.hold[row] @ self.prices)
+                    for guild in (None, *self.user_guilds.get(uid, ())):
+                        self.boards(guild)["networth"].set(row, score)
+
+    def touch(self, uid):
+        # Remembers where a user stood before a change that lands while
+        # revalue_in_thread() is sorting.
+        if self.touched is not None and uid not in self.touched:
+            self.touched[uid] = (self.rows.get(uid), self.user_guilds.get(uid, ()))
+
+    def rows_of(self, guild):
+        if guild not in self.guild_rows:
+            members = self.guild_members[guild]
+            self.guild_rows[guild] = np.fromiter((self.rows[uid] for uid in members), dtype=np.int64, count=len(members))
+        return self.guild_rows[guild]
+
+    def load_boards(self, metric, values):
+        # values is indexed by row; rebuilds the metric's board globally and
+        # for every guild from it.
+        rows = np.flatnonzero(self.active[:self.size])
+        self.global_boards[metric].load(rows, values[rows])
+        for guild in self.guild_members:
+            rows = self.rows_of(guild)
+            self.boards(guild)[metric].load(rows, values[rows])
+
+    def top(self, metric, n=10, guild=None):
+        return [(self.uid_of[row], score) for row, score in self.boards(guild)[metric].top(n)]
+
+    def rank(self, metric, uid, guild=None):
+        board = self.boards(guild)[metric]
+        row = self.rows.get(uid)
+        return (board.rank(row) if row is not None else None), len(board)
+
+    def score(self, metric, uid, guild=None):
+        row = self.rows.get(uid)
+        return self.boards(guild)[metric].score(row) if row is not None else None
+
+    def count_above(self, metric, score, guild=None):
+        # Users strictly ahead of score; with several partitions a user's
+        # rank is 1 + the sum of this over all of them.
+        return self.boards(guild)[metric].count_above(score)
+
+    def count(self, metric, guild=None):
+        return len(self.boards(guild)[metric])
+
+
+def sorted_boards(values, parts):
+    # Worker thread half of revalue_in_thread(): a fresh board for each
+    # {guild (None for global): rows} part, from values indexed by row.
+    boards = {}
+    for guild, rows in parts.items():
+        board = boards[guild] = RankIndex()
+        board.load(rows, values[rows])
+    return boards
@@ -0,0 +1,119 @@
+# Market simulation. Prices for every listed asset live in one NumPy array
+# and advance together in a single vectorized step; each tick is recorded
+# into a fixed-size ring buffer, so /price and /chart can summarize any
+# window without keeping Python objects per tick.
+
+import numpy as np
+from models import now_ts
+
+MODELS = ("gbm", "uniform")
+SPARKS = "▁▂▃▄▅▆▇█"
+
+
+class PriceHistory:
+    # Ring buffer of ticks: one timestamp and one row of prices per tick,
+    # the oldest tick overwritten once capacity is reached.
+
+    def __init__(self, capacity, assets):
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.prices = np.zeros((capacity, assets))
+        self.head = 0  # next slot to write
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def record(self, ts, prices):
+        self.times[self.head] = ts
+        self.prices[self.head] = prices
+        self.head = (self.head + 1) % len(self.times)
+        self.count = min(self.count + 1, len(self.times))
+
+    def window(self, asset, since=None):
+        # (times, prices) of one asset in chronological order, optionally
+        # only the ticks at or after since.
+        start = (self.head - self.count) % len(self.times)
+        slots = (start + np.arange(self.count)) % len(self.times)
+        times = self.times[slots]
+        if since is not None:
+            slots = slots[np.searchsorted(times, since):]
+            times = self.times[slots]
+        return times, self.prices[slots, asset]
+
+
+class Market:
+    # listings: {name: {"price": p, "vol": per-tick volatility,
+    # "drift": per-tick drift, ...}}. Models:
+    #   gbm      geometric Brownian motion; with correlation > 0 every
+    #            asset shares a market-wide shock
+    #   uniform  the old behaviour, price * (1 + uniform(-vol, vol))
+
+    def __init__(self, listings, model="gbm", correlation=0.0, history=5040, seed=None):
+        if model not in MODELS:
+            raise ValueError(f"Unknown market model {model!r}, expected one of {', '.join(MODELS)}")
+        self.names = list(listings)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.prices = np.array([info["price"] for info in listings.values()], dtype=float)
+        self.vol = np.array([info.get("vol", 0.02) for info in listings.values()], dtype=float)
+        self.drift = np.array([info.get("drift", 0.0) for info in listings.values()], dtype=float)
+        self.model = model
+        self.correlation = correlation
+        self.rng = np.random.default_rng(seed)
+        self.history = PriceHistory(history, len(self.names))
+        self.history.record(now_ts(), self.prices)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def price(self, name):
+        return float(self.prices[self.index[name]])
+
+    def shocks(self):
+        z = self.rng.standard_normal(len(self.names))
+        if self.correlation:
+            common = self.rng.standard_normal()
+            z = np.sqrt(self.correlation) * common + np.sqrt(1 - self.correlation) * z
+        return z
+
+    def step(self, ts=None):
+        if self.model == "gbm":
+            factor = np.exp(self.drift - self.vol ** 2 / 2 + self.vol * self.shocks())
+        else:
+            factor = 1 + self.rng.uniform(-1, 1, len(self.names)) * self.vol
+        self.prices = np.maximum(np.round(self.prices * factor, 2), 0.01)
+        self.history.record(ts or now_ts(), self.prices)
+        return self.prices
+
+    def follow(self, prices, ts):
+        # Takes a tick stepped by another process (the market leader of a
+        # cluster) instead of stepping locally, so every worker quotes the
+        # same prices.
+        self.prices = np.asarray(prices, dtype=float)
+        self.history.record(ts, self.prices)
+        return self.prices
+
+    def window(self, name, seconds, now=None):
+        return self.history.window(self.index[name], (now or now_ts()) - seconds)
+
+    def stats(self, name, seconds, now=None):
+        # (first, last, low, high, mean) over the window, None if no ticks.
+        _, prices = self.window(name, seconds, now)
+        if not len(prices):
+            return None
+        return float(prices[0]), float(prices[-1]), float(prices.min()), float(prices.max()), float(prices.mean())
+
+
+def sparkline(values, width=40):
+    # Buckets values into at most width columns (mean per column) and draws
+    # each column as a block character scaled between the min and max.
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return ""
+    if len(values) > width:
+        edges = np.linspace(0, len(values), width + 1).astype(int)
+        values = np.add.reduceat(values, edges[:-1]) / np.diff(edges)
+    low, high = values.min(), values.max()
+    if high == low:
+        return SPARKS[len(SPARKS) // 2] * len(values)
+    levels = ((values - low) / (high - low) * (len(SPARKS) - 1)).round().astype(int)
+    return "".join(SPARKS[i] for i in levels)
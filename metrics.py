@@ -0,0 +1,182 @@
+# In-process metrics in the Prometheus text exposition format, a small
+# local HTTP endpoint to scrape them, and a sampling profiler that can be
+# switched on and off through the same endpoint.
+#
+#   GET /metrics          all metrics
+#   GET /profile/start    start sampling the event loop thread
+#   GET /profile/stop     stop and return folded stacks (flamegraph.pl,
+#                         speedscope) with the hottest first
+
+import os, sys, threading, time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9)
+
+
+class Family:
+    __slots__ = ("name", "kind", "help", "buckets", "values")
+
+    def __init__(self, name, kind, help, buckets):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.buckets = buckets
+        # labels (sorted tuple of pairs) -> number, or for histograms
+        # [count per bucket..., count above the last bucket, sum, count]
+        self.values = {}
+
+
+class Metrics:
+    def __init__(self):
+        self.families = {}
+        # Callables taking this object, run before every render to refresh
+        # gauges that are cheaper to read on demand than to keep updated.
+        self.collectors = []
+
+    def describe(self, name, kind, help, buckets=LATENCY_BUCKETS):
+        # kind is "counter", "gauge" or "histogram". Describing a metric
+        # again is a no-op, so several components can share one registry.
+        if name not in self.families:
+            self.families[name] = Family(name, kind, help, buckets)
+        return self.families[name]
+
+    def inc(self, name, value=1, **labels):
+        values = self.families[name].values
+        key = tuple(sorted(labels.items()))
+        values[key] = values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.families[name].values[tuple(sorted(labels.items()))] = value
+
+    def observe(self, name, value, **labels):
+        family = self.families[name]
+        key = tuple(sorted(labels.items()))
+        hist = family.values.get(key)
+        if hist is None:
+            hist = family.values[key] = [0] * (len(family.buckets) + 1) + [0.0, 0]
+        hist[bisect_left(family.buckets, value)] += 1
+        hist[-2] += value
+        hist[-1] += 1
+
+    @contextmanager
+    def time(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self):
+        for collect in self.collectors:
+            collect(self)
+        lines = []
+        for family in self.families.values():
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for key, value in family.values.items():
+                if family.kind != "histogram":
+                    lines.append(f"{family.name}{format_labels(key)} {format_value(value)}")
+                    continue
+                cumulative = 0
+                for le, count in zip(family.buckets + (float("inf"),), value):
+                    cumulative += count
+                    lines.append(f"{family.name}_bucket{format_labels(key + (('le', format_value(le)),))} {cumulative}")
+                lines.append(f"{family.name}_sum{format_labels(key)} {format_value(value[-2])}")
+                lines.append(f"{family.name}_count{format_labels(key)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(key):
+    if not key:
+        return ""
+    pairs = []
+    for name, value in key:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
+
+
+class SamplingProfiler:
+    # Samples one thread's stack (the event loop's, by default the thread
+    # that calls start) every interval seconds from a background thread and
+    # counts identical stacks. Costs nothing while stopped.
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.thread = None
+        self.target = None
+        self.running = False
+        self.samples = Counter()
+
+    def start(self, thread_id=None):
+        if self.running:
+            return False
+        self.target = thread_id or threading.get_ident()
+        self.samples = Counter()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        return self.folded()
+
+    def run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.target)
+            if frame is not None:
+                self.samples[fold(frame)] += 1
+            time.sleep(self.interval)
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def fold(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+async def serve(metrics, host="127.0.0.1", port=9100, profiler=None):
+    # Starts the endpoint on the running loop and returns the aiohttp
+    # runner (await runner.cleanup() to stop it).
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(body=metrics.render().encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def handle_profile_start(request):
+        started = profiler.start()
+        return web.Response(text="profiler started\n" if started else "profiler already running\n")
+
+    async def handle_profile_stop(request):
+        return web.Response(text=profiler.stop())
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    if profiler is not None:
+        app.router.add_get("/profile/start", handle_profile_start)
+        app.router.add_get("/profile/stop", handle_profile_stop)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,30 @@
+# One-shot copy of an economy between storage backends, e.g. to move an
+# existing economy.json into SQLite:
+#
+#   python migrate.py --from json --to sqlite
+#   python migrate.py --file /data/economy.json --from json --to sqlite
+
+import argparse, os
+from storage import backend_path
+from backup import iter_records, upgraded, import_records
+
+
+def migrate(data_file, src_mode, dst_mode):
+    # Streams the records across (see backup.py), so this works on
+    # economies larger than memory; upgraded() brings older records up to
+    # date on the way.
+    return import_records(upgraded(iter_records(data_file, src_mode)), data_file, dst_mode)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy the economy from one storage backend to another.")
+    parser.add_argument("--file", default=os.getenv("VOLUME_PATH", ".") + "/economy.json")
+    parser.add_argument("--from", dest="src", default="json")
+    parser.add_argument("--to", dest="dst", default="sqlite")
+    args = parser.parse_args()
+    count = migrate(args.file, args.src, args.dst)
+    print(f"✅ Migrated {count} users from {args.src} to {args.dst} ({backend_path(args.file, args.dst)}).")
+
+
+if __name__ == "__main__":
+    main()
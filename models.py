@@ -0,0 +1,167 @@
+import time
+from datetime import datetime, timezone
+from achievements import engine as achievement_engine
+
+
+def now_ts():
+    return int(time.time())
+
+
+def to_epoch(value):
+    # Timestamps used to be stored as naive UTC ISO strings; accept those,
+    # numeric strings (old SQLite columns) and plain numbers.
+    if value is None or value == "":
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(float(value))
+    except ValueError:
+        return int(datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp())
+
+
+class User:
+    # One economy user. Timestamps are integer epoch seconds, 0 meaning
+    # "never": daily/work hold the last claim, cooldowns the last use of
+    # each command and boosters their expiry. inv and investments map a
+    # crypto name to the amount held; most users hold one or two, so a
+    # small dict stays cheaper than a fixed per-asset array. quest_day and
+    # quest_progress hold the user's daily quest progress (see quests.py)
+    # and are stored as the daily_quests dict.
+    # achievements is a bitset over achievement_engine's keys. guilds holds
+    # the ids of the guilds the user has played in, for per-guild boards.
+    # reminders names the cooldowns the user wants a DM for when they end.
+    #
+    # Records only become dicts again at the storage boundary (to_dict /
+    # from_dict). Those dicts are sparse: to_dict leaves out every field
+    # that still has its default (DEFAULT_RECORD), and from_dict fills them
+    # back in, so a user who only ever claimed /daily is a few bytes rather
+    # than a full record. Older full records load the same as before.
+
+    __slots__ = (
+        "bal", "exp", "lvl", "daily", "work", "inv", "achievements", "job",
+        "job_lvl", "job_exp", "boosters", "cooldowns", "quest_day", "quest_progress", "investments", "guilds",
+        "reminders",
+    )
+
+    def __init__(self):
+        self.bal = 1000
+        self.exp = 0
+        self.lvl = 1
+        self.daily = 0
+        self.work = 0
+        self.inv = {}
+        self.achievements = 0
+        self.job = None
+        self.job_lvl = 1
+        self.job_exp = 0
+        self.boosters = {}
+        self.cooldowns = {}
+        self.quest_day = 0
+        self.quest_progress = ()
+        self.investments = {}
+        self.guilds = ()
+        self.reminders = ()
+
+    def copy(self):
+        clone = User.__new__(User)
+        clone.bal = self.bal
+        clone.exp = self.exp
+        clone.lvl = self.lvl
+        clone.daily = self.daily
+        clone.work = self.work
+        clone.inv = dict(self.inv)
+        clone.achievements = self.achievements
+        clone.job = self.job
+        clone.job_lvl = self.job_lvl
+        clone.job_exp = self.job_exp
+        clone.boosters = dict(self.boosters)
+        clone.cooldowns = dict(self.cooldowns)
+        clone.quest_day = self.quest_day
+        clone.quest_progress = self.quest_progress
+        clone.investments = dict(self.investments)
+        clone.guilds = self.guilds
+        clone.reminders = self.reminders
+        return clone
+
+    def same_as(self, other):
+        # True if no field differs, so a commit can leave the stored record be.
+        return all(getattr(self, name) == getattr(other, name) for name in User.__slots__)
+
+    @classmethod
+    def from_dict(cls, d):
+        user = cls()
+        user.bal = d.get("bal", 1000)
+        user.exp = d.get("exp", 0)
+        user.lvl = d.get("lvl", 1)
+        user.daily = to_epoch(d.get("daily"))
+        user.work = to_epoch(d.get("work"))
+        user.inv = dict(d.get("inv") or {})
+        user.achievements = achievement_engine.to_bits(d.get("achievements") or [])
+        user.job = d.get("job")
+        user.job_lvl = d.get("job_lvl", 1)
+        user.job_exp = d.get("job_exp", 0)
+        user.boosters = {k: to_epoch(v) for k, v in (d.get("boosters") or {}).items()}
+        user.cooldowns = {k: to_epoch(v) for k, v in (d.get("cooldowns") or {}).items()}
+        # Records from before quests.py hold {"claimed": ..., "quests": []},
+        # which reads as day 0: long stale.
+        quests = d.get("daily_quests") or {}
+        user.quest_day = quests.get("day", 0)
+        user.quest_progress = tuple(quests.get("progress") or ())
+        user.investments = dict(d.get("investments") or {})
+        user.guilds = tuple(d.get("guilds") or ())
+        user.reminders = tuple(d.get("reminders") or ())
+        return user
+
+    def to_dict(self):
+        d = {}
+        if self.bal != 1000:
+            d["bal"] = self.bal
+        if self.exp:
+            d["exp"] = self.exp
+        if self.lvl != 1:
+            d["lvl"] = self.lvl
+        if self.daily:
+            d["daily"] = self.daily
+        if self.work:
+            d["work"] = self.work
+        if self.inv:
+            d["inv"] = self.inv
+        if self.achievements:
+            d["achievements"] = achievement_engine.to_keys(self.achievements)
+        if self.job is not None:
+            d["job"] = self.job
+        if self.job_lvl != 1:
+            d["job_lvl"] = self.job_lvl
+        if self.job_exp:
+            d["job_exp"] = self.job_exp
+        if self.boosters:
+            d["boosters"] = self.boosters
+        if self.cooldowns:
+            d["cooldowns"] = self.cooldowns
+        if self.quest_day:
+            d["daily_quests"] = {"day": self.quest_day, "progress": list(self.quest_progress)}
+        if self.investments:
+            d["investments"] = self.investments
+        if self.guilds:
+            d["guilds"] = list(self.guilds)
+        if self.reminders:
+            d["reminders"] = list(self.reminders)
+        return d
+
+    def is_default(self):
+        # True for a user nobody has changed yet, the same as a missing one.
+        return (
+            self.bal == 1000 and not self.exp and self.lvl == 1 and not self.daily and not self.work
+            and not self.inv and not self.achievements and self.job is None and self.job_lvl == 1
+            and not self.job_exp and not self.boosters and not self.cooldowns and not self.quest_day
+            and not self.investments and not self.guilds and not self.reminders
+        )
+
+
+# A new user's record in full, for backends with a column per field.
+DEFAULT_RECORD = {
+    "bal": 1000, "exp": 0, "lvl": 1, "daily": None, "work": None, "inv": {}, "achievements": [],
+    "job": None, "job_lvl": 1, "job_exp": 0, "boosters": {}, "cooldowns": {},
+    "daily_quests": {"day": 0, "progress": []}, "investments": {}, "guilds": [], "reminders": [],
+}
@@ -0,0 +1,54 @@
+import asyncio, time
+from metrics import Metrics
+
+
+class LoopLagMonitor:
+    # Sleeps for `interval` seconds in a loop and measures how late it wakes
+    # up. Anything beyond the interval is time the event loop spent blocked
+    # on something else (a slow handler, synchronous I/O, a big JSON dump),
+    # during which gateway heartbeats and other interactions had to wait.
+
+    def __init__(self, interval=0.25, warn_after=0.5, metrics=None):
+        self.interval = interval
+        self.warn_after = warn_after
+        self.metrics = metrics or Metrics()
+        self.metrics.describe("economy_loop_lag_seconds", "histogram", "How late the event loop woke up from a sleep.")
+        self.task = None
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.samples = 0
+        self.warnings = 0
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    async def run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.record(time.perf_counter() - start - self.interval)
+
+    def record(self, lag):
+        lag = max(0.0, lag)
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.total_lag += lag
+        self.samples += 1
+        self.metrics.observe("economy_loop_lag_seconds", lag)
+        if lag >= self.warn_after:
+            self.warnings += 1
+            print(f"⚠️ Event loop was blocked for {lag * 1000:.0f}ms")
+
+    def reset_max(self):
+        max_lag, self.max_lag = self.max_lag, 0.0
+        return max_lag
+
+    def summary(self):
+        avg = self.total_lag / self.samples if self.samples else 0.0
+        return f"loop lag: last {self.last_lag * 1000:.1f}ms, avg {avg * 1000:.1f}ms, max {self.max_lag * 1000:.1f}ms"
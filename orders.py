@@ -0,0 +1,138 @@
+# Limit and market orders for the crypto market. /buy and /sell queue an
+# order here, and every market tick settles everything the new prices fill
+# in one batch: match() hands back the fills and main.py applies them to all
+# the users involved in a single store transaction, so a tick costs one
+# commit (and at most one flush) however many orders it fills.
+#
+# The market itself is the counterparty: a market order fills at the next
+# tick, a limit order at the first tick whose price reaches its limit, and
+# both at the tick price. Nothing is reserved when an order is placed;
+# funds and holdings are checked when it fills and an order that can't be
+# paid for is dropped. Open orders only live in memory, so a restart
+# cancels them (and since nothing was reserved, costs nobody anything).
+
+import itertools
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+
+BUY = "buy"
+SELL = "sell"
+INF = float("inf")
+
+
+class Order:
+    __slots__ = ("id", "uid", "side", "asset", "amount", "limit", "placed")
+
+    def __init__(self, id, uid, side, asset, amount, limit, placed):
+        self.id = id
+        self.uid = uid
+        self.side = side
+        self.asset = asset
+        self.amount = amount
+        self.limit = limit  # None for a market order
+        self.placed = placed
+
+    def describe(self):
+        at = "at market" if self.limit is None else f"limit {self.limit:,.2f}"
+        return f"#{self.id} {self.side} {self.amount} {self.asset} {at}"
+
+
+class OrderBook:
+    # One sorted list of (key, order id) per asset and side, best first:
+    # buys by highest limit, sells by lowest, market orders ahead of both,
+    # then oldest first. The orders a price fills are always a prefix, so
+    # matching costs O(fills + log orders) per book rather than a pass over
+    # every open order.
+
+    def __init__(self, assets, max_open=20, history=5):
+        self.assets = list(assets)
+        self.max_open = max_open
+        self.history = history
+        self.books = {(asset, side): [] for asset in self.assets for side in (BUY, SELL)}
+        self.orders = {}   # id -> Order
+        self.by_user = {}  # uid -> {id: Order}, oldest first
+        self.recent = {}   # uid -> deque of (order, price, filled), newest first
+        self.ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self.orders)
+
+    @staticmethod
+    def key(order):
+        if order.limit is None:
+            return (-INF, order.id)
+        return (-order.limit if order.side == BUY else order.limit, order.id)
+
+    def open_orders(self, uid):
+        return list(self.by_user.get(uid, {}).values())
+
+    def place(self, uid, side, asset, amount, limit=None, now=0):
+        # The new Order, or None if the user already has max_open orders.
+        if len(self.by_user.get(uid, ())) >= self.max_open:
+            return None
+        order = Order(next(self.ids), uid, side, asset, amount, limit, now)
+        insort(self.books[(asset, side)], self.key(order))
+        self.orders[order.id] = order
+        self.by_user.setdefault(uid, {})[order.id] = order
+        return order
+
+    def cancel(self, uid, order_id):
+        order = self.orders.get(order_id)
+        if order is None or order.uid != uid:
+            return None
+        book = self.books[(order.asset, order.side)]
+        del book[bisect_left(book, self.key(order))]
+        self.forget(order)
+        return order
+
+    def forget(self, order):
+        del self.orders[order.id]
+        mine = self.by_user[order.uid]
+        del mine[order.id]
+        if not mine:
+            del self.by_user[order.uid]
+
+    def match(self, prices):
+        # Removes and returns [(order, price)] for every order the new
+        # prices (one per asset, in self.assets order) fill.
+        fills = []
+        for asset, price in zip(self.assets, prices):
+            price = float(price)
+            for side, bound in ((BUY, -price), (SELL, price)):
+                book = self.books[(asset, side)]
+                n = bisect_right(book, (bound, INF))
+                if not n:
+                    continue
+                for _, order_id in book[:n]:
+                    order = self.orders[order_id]
+                    self.forget(order)
+                    fills.append((order, price))
+                del book[:n]
+        return fills
+
+    def record(self, order, price, filled):
+        recent = self.recent.get(order.uid)
+        if recent is None:
+            recent = self.recent[order.uid] = deque(maxlen=self.history)
+        recent.appendleft((order, price, filled))
+
+
+def apply_fill(user, order, price):
+    # Settles one fill on the user's record; False if they can no longer
+    # pay for it (or no longer hold what they're selling).
+    cost = price * order.amount
+    if order.side == BUY:
+        if user.bal < cost:
+            return False
+        user.bal -= cost
+        user.inv[order.asset] = user.inv.get(order.asset, 0) + order.amount
+        return True
+    held = user.inv.get(order.asset, 0)
+    if held < order.amount:
+        return False
+    if held == order.amount:
+        del user.inv[order.asset]
+    else:
+        user.inv[order.asset] = held - order.amount
+    user.bal += cost
+    return True
@@ -0,0 +1,199 @@
+# Messages the bot sends on its own rather than as the reply to an
+# interaction: reminder DMs today, level-ups, achievements, booster expiry
+# and event announcements as they come. Anything can post() a notice
+# without waiting; a few delivery tasks send them in the background.
+#
+# Notices queue per destination, a user's DMs or a channel. Everything
+# pending for a destination when its turn comes goes out as one message
+# (split at Discord's 2000 characters), so a burst of notices for one user
+# costs one request instead of one each, and the busier the bot the more
+# gets coalesced. Destinations take turns in the order their first pending
+# notice arrived.
+#
+# Sends are paced by a token bucket: `rate` per second, up to `burst` at
+# once. The send function can also hand back the response's rate limit
+# headers: a destination whose route has no requests left waits out
+# X-RateLimit-Reset-After while the others carry on. A 429 (RateLimited)
+# puts the notices back and waits Retry-After, everyone if it was the
+# global limit.
+
+import asyncio, itertools, time
+from collections import deque
+from metrics import Metrics
+
+USER = "user"
+CHANNEL = "channel"
+MESSAGE_LIMIT = 2000
+
+
+class RateLimited(Exception):
+    # Raised by a send function when Discord answers 429.
+
+    def __init__(self, retry_after, is_global=False):
+        super().__init__(f"rate limited for {retry_after:.2f}s")
+        self.retry_after = retry_after
+        self.is_global = is_global
+
+    @classmethod
+    def from_headers(cls, headers):
+        retry_after = float(headers.get("Retry-After") or headers.get("X-RateLimit-Reset-After") or 1)
+        is_global = headers.get("X-RateLimit-Global", "").lower() == "true" or headers.get("X-RateLimit-Scope") == "global"
+        return cls(retry_after, is_global)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.last = time.monotonic()
+
+    def take(self, now=None):
+        # Takes a token and returns how long to wait before using it, 0 if
+        # one was there. The count goes negative so that concurrent takers
+        # line up behind each other instead of all waiting for the same one.
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class Outbox:
+    def __init__(self, send, rate=5, burst=None, workers=4, metrics=None):
+        self.send = send  # async (dest, content) -> rate limit headers or None
+        self.bucket = TokenBucket(rate, burst)
+        self.workers = workers
+        self.metrics = metrics or Metrics()
+        self.metrics.describe("discord_outbox_pending", "gauge", "Users and channels with notices waiting to be sent.")
+        self.metrics.describe("discord_outbox_messages_total", "counter", "Messages sent by the outbox.")
+        self.metrics.describe("discord_outbox_notices_total", "counter", "Notices delivered, several to a message when coalesced.")
+        self.metrics.describe("discord_outbox_rate_limited_total", "counter", "Sends answered with a 429.")
+        self.metrics.collectors.append(lambda m: m.set("discord_outbox_pending", len(self)))
+        self.pending = {}       # dest -> {key: notice}, oldest first
+        self.turns = deque()    # dests with pending notices, waiting for a turn
+        self.sending = set()    # dests with a send in flight
+        self.blocked = {}       # dest -> monotonic time its route has requests again
+        self.paused_until = 0.0  # after a global 429
+        self.wakeup = asyncio.Event()
+        self.keys = itertools.count()
+        self.tasks = []
+
+    def __len__(self):
+        return len(self.pending)
+
+    def post(self, dest, notice, key=None):
+        # dest is (USER, uid) or (CHANNEL, channel id). notice is the text,
+        # or a function returning it (or None to drop it) when it's sent,
+        # for notices that may no longer apply by then. A notice posted
+        # under the same key as one still pending replaces it.
+        notices = self.pending.get(dest)
+        if notices is None:
+            notices = self.pending[dest] = {}
+            if dest not in self.sending:
+                self.turns.append(dest)
+                self.wakeup.set()
+        notices[next(self.keys) if key is None else key] = notice
+
+    def start(self):
+        self.tasks = [task for task in self.tasks if not task.done()]
+        loop = asyncio.get_running_loop()
+        while len(self.tasks) < self.workers:
+            self.tasks.append(loop.create_task(self.run()))
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    async def run(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            dest = self.next_turn(now)
+            if dest is None:
+                self.wakeup.clear()
+                await self.wait(self.next_unblocked(now))
+                continue
+            self.sending.add(dest)
+            try:
+                wait = self.bucket.take()
+                if wait:
+                    await asyncio.sleep(wait)  # notices keep coalescing meanwhile
+                await self.deliver(dest)
+            finally:
+                self.sending.discard(dest)
+                if dest in self.pending:
+                    self.turns.append(dest)
+                    self.wakeup.set()
+
+    def next_turn(self, now):
+        # The first waiting destination whose route isn't blocked; blocked
+        # ones keep their place.
+        for _ in range(len(self.turns)):
+            dest = self.turns.popleft()
+            until = self.blocked.get(dest)
+            if until is None:
+                return dest
+            if until <= now:
+                del self.blocked[dest]
+                return dest
+            self.turns.append(dest)
+        return None
+
+    def next_unblocked(self, now):
+        # Seconds until a waiting destination's route frees up, None if
+        # nothing is waiting.
+        times = [self.blocked[dest] for dest in self.turns if dest in self.blocked]
+        return max(0.0, min(times) - now) if times else None
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def deliver(self, dest):
+        notices = self.pending.pop(dest, None)
+        if not notices:
+            return
+        items = list(notices.items())
+        lines, size, left = [], -1, {}
+        for i, (key, notice) in enumerate(items):
+            text = notice() if callable(notice) else notice
+            if not text:
+                continue
+            text = text[:MESSAGE_LIMIT]
+            if lines and size + 1 + len(text) > MESSAGE_LIMIT:
+                left = dict(items[i:])  # the rest waits for the next turn
+                break
+            lines.append(text)
+            size += 1 + len(text)
+        if not lines:
+            return
+        try:
+            headers = await self.send(dest, "\n".join(lines))
+        except RateLimited as e:
+            self.put_back(dest, notices)
+            until = time.monotonic() + e.retry_after
+            if e.is_global:
+                self.paused_until = max(self.paused_until, until)
+            else:
+                self.blocked[dest] = until
+            self.metrics.inc("discord_outbox_rate_limited_total")
+            return
+        except Exception as e:
+            print(f"❌ Could not send to {dest[0]} {dest[1]}: {e}")
+            return
+        if left:
+            self.put_back(dest, left)
+        self.metrics.inc("discord_outbox_messages_total")
+        self.metrics.inc("discord_outbox_notices_total", len(lines))
+        if headers and headers.get("X-RateLimit-Remaining") == "0":
+            self.blocked[dest] = time.monotonic() + float(headers.get("X-RateLimit-Reset-After") or 1)
+
+    def put_back(self, dest, notices):
+        # Ahead of anything posted for dest while the send was in flight.
+        self.pending[dest] = {**notices, **self.pending.get(dest, {})}
@@ -0,0 +1,117 @@
+# Daily quests. Every day has its own few quests, picked at random from
+# TEMPLATES with the day number as the seed, so every process (and every
+# worker of a cluster) agrees on today's quests without storing them.
+#
+# A user's quest state is the day it belongs to plus one progress count
+# per quest. Nothing runs at the daily reset: state from an earlier day
+# simply reads as no progress, and is replaced the first time the user
+# does something that counts today. Commands report events for the user
+# running them and only that user's state is touched; a quest pays its
+# reward the moment its target is reached.
+
+import random, time
+
+# Events commands report.
+WORK = "work"
+COINFLIP_WIN = "coinflip_win"
+BUY_FILLED = "buy_filled"
+LOOTBOX = "lootbox"
+INVEST = "invest"
+DAILY = "daily"
+ROB = "rob"
+
+DAY = 24 * 3600
+
+
+class Quest:
+    __slots__ = ("event", "target", "reward", "desc")
+
+    def __init__(self, event, target, reward, desc):
+        self.event = event
+        self.target = target
+        self.reward = reward
+        self.desc = desc
+
+
+# (event, description, smallest and largest target, reward per unit of
+# target). {s}, {es} and {ies} are plural endings, empty (or "y") for 1.
+TEMPLATES = [
+    (WORK, "Work {n} time{s}", 2, 4, 300),
+    (COINFLIP_WIN, "Win {n} coinflip{s}", 1, 3, 400),
+    (BUY_FILLED, "Get {n} buy order{s} filled", 1, 3, 350),
+    (LOOTBOX, "Open {n} lootbox{es}", 1, 2, 500),
+    (INVEST, "Invest {n:,} coins", 1000, 5000, 0.3),
+    (DAILY, "Claim your daily reward", 1, 1, 500),
+    (ROB, "Pull off {n} successful robber{ies}", 1, 2, 600),
+]
+
+
+class QuestBoard:
+    def __init__(self, templates=TEMPLATES, per_day=3, reset_hour=0, seed="quests"):
+        self.templates = templates
+        self.per_day = min(per_day, len(templates))
+        self.offset = reset_hour * 3600
+        self.seed = seed
+        self.cache = {}  # day -> quests, only today's (and yesterday's) kept
+
+    def day(self, now=None):
+        # Days count from the epoch, each starting at reset_hour UTC.
+        return (int(now if now is not None else time.time()) - self.offset) // DAY
+
+    def resets_in(self, now=None):
+        now = int(now if now is not None else time.time())
+        return (self.day(now) + 1) * DAY + self.offset - now
+
+    def quests(self, day):
+        quests = self.cache.get(day)
+        if quests is None:
+            rng = random.Random(f"{self.seed}:{day}")
+            quests = []
+            for event, desc, low, high, per_unit in rng.sample(self.templates, self.per_day):
+                target = rng.randint(low, high)
+                if high >= 1000:
+                    target = target // 100 * 100
+                one = target == 1
+                desc = desc.format(n=target, s="" if one else "s", es="" if one else "es", ies="y" if one else "ies")
+                quests.append(Quest(event, target, int(target * per_unit), desc))
+            if len(self.cache) > 1:
+                self.cache.clear()
+            self.cache[day] = quests
+        return quests
+
+    def progress(self, user, day):
+        # The user's progress on day's quests; stale state reads as none.
+        # So does progress for a different number of quests: the bot was
+        # restarted with another QUESTS_PER_DAY or template list today, and
+        # the counts no longer line up with today's quests.
+        quests = self.quests(day)
+        if user.quest_day != day or len(user.quest_progress) != len(quests):
+            return (0,) * len(quests)
+        return user.quest_progress
+
+    def record(self, user, event, amount=1, now=None):
+        # Counts an event for user and pays any quest it completes. Returns
+        # the completed quests. Leaves the user alone if no quest today
+        # counts the event.
+        day = self.day(now)
+        quests = self.quests(day)
+        if not any(quest.event == event for quest in quests):
+            return []
+        progress = list(self.progress(user, day))
+        done = []
+        for i, quest in enumerate(quests):
+            if quest.event != event or progress[i] >= quest.target:
+                continue
+            progress[i] = min(quest.target, progress[i] + amount)
+            if progress[i] >= quest.target:
+                user.bal += quest.reward
+                done.append(quest)
+        user.quest_day = day
+        user.quest_progress = tuple(progress)
+        return done
+
+
+def quests_msg(done):
+    if not done:
+        return ""
+    return "\n" + "\n".join(f"📜 Daily quest complete: {quest.desc} (+{quest.reward:,} coins)" for quest in done)
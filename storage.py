@@ -0,0 +1,536 @@
+import os, json, time, threading, sqlite3, asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from models import User, DEFAULT_RECORD
+from metrics import Metrics, BYTES_BUCKETS
+
+
+class EconomyStore:
+    # Keeps the whole economy resident in memory. Commands change users
+    # inside transaction() and the store marks them dirty; the backend only
+    # sees the dirty users when flush() runs, which happens on a timer, at
+    # shutdown, or as soon as flush_threshold users are waiting to be
+    # written. A flush_interval of 0 writes through on every transaction.
+    #
+    # Records are models.User objects; backends deal in plain dicts and the
+    # conversion happens here, on the way in and out. Backend calls and the
+    # conversion/JSON work run on a small thread pool so they never block
+    # the event loop. To make that safe, a record is never mutated once it
+    # is in self.data: transactions work on a copy and swap it in on commit,
+    # so a flush in progress always sees whole records.
+
+    def __init__(self, backend, flush_interval=30, flush_threshold=500, io_workers=2, metrics=None):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="economy-io")
+        self.data = {}
+        self.dirty = set()
+        self.last_flush = time.monotonic()
+        self.locks = {}
+        self.flush_lock = asyncio.Lock()
+        self.flush_task = None
+        # Callables taking (uid, user) that are told about every committed
+        # change; user is None when the user was deleted.
+        self.listeners = []
+        self.metrics = metrics or Metrics()
+        self.metrics.describe("economy_storage_seconds", "histogram", "Time spent loading from or flushing to the backend.")
+        self.metrics.describe("economy_storage_errors_total", "counter", "Failed backend loads and flushes.")
+        self.metrics.describe("economy_storage_bytes_total", "counter", "Bytes read from and written to the backend.")
+        self.metrics.describe("economy_flush_bytes", "histogram", "Bytes written per flush.", BYTES_BUCKETS)
+        self.metrics.describe("economy_flushed_users_total", "counter", "User records written by flushes.")
+        self.metrics.describe("economy_users", "gauge", "Users held in memory.")
+        self.metrics.describe("economy_dirty_users", "gauge", "Changed users waiting for the next flush.")
+        self.metrics.describe("economy_flush_age_seconds", "gauge", "Seconds since the last successful flush.")
+        self.metrics.collectors.append(self.collect)
+
+    def collect(self, metrics):
+        metrics.set("economy_users", len(self.data))
+        metrics.set("economy_dirty_users", len(self.dirty))
+        metrics.set("economy_flush_age_seconds", round(time.monotonic() - self.last_flush, 3))
+
+    async def run_io(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def load(self):
+        try:
+            with self.metrics.time("economy_storage_seconds", op="load"):
+                self.data, untouched = await self.run_io(self.load_records)
+        except BaseException:
+            self.metrics.inc("economy_storage_errors_total", op="load")
+            raise
+        self.metrics.inc("economy_storage_bytes_total", self.backend.stored_bytes(), direction="read")
+        self.dirty = set(untouched)
+        if untouched:
+            print(f"Dropping {len(untouched)} stored users that never changed from the defaults.")
+        return self.data
+
+    def load_records(self):
+        # Also returns the uids of stored users that are all defaults: reads
+        # make those up on the fly (view), so they are dropped from storage.
+        data = {}
+        untouched = []
+        for uid, record in self.backend.load().items():
+            user = User.from_dict(record)
+            if user.is_default():
+                untouched.append(uid)
+            else:
+                data[uid] = user
+        return data, untouched
+
+    def write_records(self, data, dirty):
+        return self.backend.write({uid: user.to_dict() for uid, user in data.items()}, dirty)
+
+    def get(self, uid):
+        return self.data.get(uid)
+
+    def mark_dirty(self, *uids):
+        self.dirty.update(uids)
+        if len(self.dirty) >= self.flush_threshold and not (self.flush_task and not self.flush_task.done()):
+            self.flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    def delete(self, uid):
+        if self.data.pop(uid, None) is None:
+            return False
+        self.mark_dirty(uid)
+        self.notify(uid)
+        return True
+
+    async def view(self, uid):
+        # Read-only access for commands that only display a record: a user
+        # with no record gets a default one that isn't stored. Async so that
+        # a partitioned store can fetch it from the worker that owns it.
+        user = self.data.get(uid)
+        return User() if user is None else user
+
+    async def remove(self, uid):
+        async with self.lock(uid):
+            return self.delete(uid)
+
+    def notify(self, uid):
+        user = self.data.get(uid)
+        for listener in self.listeners:
+            listener(uid, user)
+
+    @asynccontextmanager
+    async def lock(self, *uids):
+        # Per-user locks, always taken in sorted uid order so two commands
+        # locking the same pair of users can never deadlock. Entries are
+        # dropped again once nobody holds or waits for them.
+        entries = []
+        acquired = 0
+        try:
+            for uid in sorted(set(uids)):
+                entry = self.locks.get(uid)
+                if entry is None:
+                    entry = self.locks[uid] = [asyncio.Lock(), 0]
+                entry[1] += 1
+                entries.append((uid, entry))
+                await entry[0].acquire()
+                acquired += 1
+            yield
+        finally:
+            for i, (uid, entry) in enumerate(entries):
+                if i < acquired:
+                    entry[0].release()
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.locks[uid]
+
+    @asynccontextmanager
+    async def transaction(self, *uids):
+        # Locks the given users and yields working copies of their records,
+        # creating them if needed (a single record for a single uid,
+        # otherwise a list in the order given). The copies replace the
+        # stored records when the block finishes; if it raises, nothing
+        # changes.
+        async with self.lock(*uids):
+            working = self.checkout(uids)
+            records = [working[uid] for uid in uids]
+            yield records[0] if len(records) == 1 else records
+            await self.commit(working)
+
+    def checkout(self, uids):
+        # Working copies of the records, for a caller holding their locks.
+        working = {}
+        for uid in uids:
+            if uid not in working:
+                user = self.data.get(uid)
+                working[uid] = User() if user is None else user.copy()
+        return working
+
+    async def commit(self, working):
+        # working maps uids to their new records; None deletes the user.
+        # Records that come back as they were (a refused command, a bet the
+        # user couldn't cover) are left alone: not marked dirty, no listener
+        # told. Likewise a new user who is still all defaults (the target of
+        # a failed /rob, say) isn't created: view() makes them up the same way.
+        changed = {}
+        for uid, user in working.items():
+            old = self.data.get(uid)
+            if user is None:
+                if old is not None:
+                    changed[uid] = None
+            elif not (user.is_default() if old is None else user.same_as(old)):
+                changed[uid] = user
+        if not changed:
+            return
+        working = changed
+        self.data.update(working)
+        for uid in [uid for uid, user in working.items() if user is None]:
+            del self.data[uid]
+        self.mark_dirty(*working)
+        for uid in working:
+            self.notify(uid)
+        if self.flush_interval <= 0:
+            await self.flush()
+
+    def snapshot(self, dirty):
+        if self.backend.full_snapshot:
+            return dict(self.data)
+        return {uid: self.data[uid] for uid in dirty if uid in self.data}
+
+    async def flush(self):
+        async with self.flush_lock:
+            if not self.dirty:
+                return False
+            dirty, self.dirty = self.dirty, set()
+            start = time.perf_counter()
+            try:
+                written = await self.run_io(self.write_records, self.snapshot(dirty), dirty)
+            except BaseException:
+                self.dirty |= dirty
+                self.metrics.inc("economy_storage_errors_total", op="flush")
+                raise
+            self.metrics.observe("economy_storage_seconds", time.perf_counter() - start, op="flush")
+            self.metrics.observe("economy_flush_bytes", written)
+            self.metrics.inc("economy_storage_bytes_total", written, direction="written")
+            self.metrics.inc("economy_flushed_users_total", len(dirty))
+            self.last_flush = time.monotonic()
+            return True
+
+    def close(self):
+        # Called after the event loop has stopped, so this writes directly.
+        # A flush cancelled on the way out (SIGINT) has put its users back in
+        # dirty, but its write may still be running on an I/O thread: wait
+        # for that before writing the same files, or closing the backend
+        # under it. Writing those users again is harmless.
+        self.executor.shutdown(wait=True)
+        if self.dirty:
+            self.write_records(self.snapshot(self.dirty), self.dirty)
+            self.dirty.clear()
+        self.backend.close()
+
+
+### BACKENDS ###
+# A backend loads the full {uid: record} dict once at startup and is then
+# handed the set of uids that changed since the last write, together with
+# their records (or every record, if the backend sets full_snapshot). Dirty
+# uids missing from data have been deleted. Both methods run on the store's
+# I/O threads; write returns the number of bytes it wrote.
+
+class JsonBackend:
+    # The original economy.json format: one file, rewritten atomically.
+
+    full_snapshot = True
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            print(f"❌ Could not parse {self.path}, starting empty: {e}")
+            return {}
+
+    def write(self, data, dirty):
+        write_json_atomic(self.path, data, self.fsync, indent=2)
+        return os.path.getsize(self.path)
+
+    def stored_bytes(self):
+        return file_size(self.path)
+
+    def close(self):
+        pass
+
+
+class JournalBackend(JsonBackend):
+    # Appends the dirty users to an append-only journal next to the snapshot.
+    # Each journal line holds the full record of one user (or null when the
+    # user was deleted), so replaying a line twice is harmless and recovery
+    # is just "load snapshot, replay journals in order". Once the journal
+    # grows past compact_threshold lines it is rotated and folded into a
+    # fresh snapshot on a background thread.
+
+    full_snapshot = False
+
+    def __init__(self, path, fsync=False, compact_threshold=10_000):
+        super().__init__(path, fsync)
+        self.journal_path = path + ".journal"
+        self.rotated_path = path + ".journal.1"
+        self.compact_threshold = compact_threshold
+        self.journal = None
+        self.journal_lines = 0
+        self.compactor = None
+
+    def load(self):
+        data = super().load()
+        self.journal_lines = 0
+        for p in (self.rotated_path, self.journal_path):
+            self.journal_lines += replay_journal(p, data)
+        self.journal = open(self.journal_path, "a")
+        return data
+
+    def write(self, data, dirty):
+        lines = []
+        for uid in dirty:
+            lines.append(json.dumps([uid, data.get(uid)], separators=(",", ":")))
+        text = "\n".join(lines) + "\n"
+        self.journal.write(text)
+        self.journal.flush()
+        if self.fsync:
+            os.fsync(self.journal.fileno())
+        self.journal_lines += len(lines)
+        if self.journal_lines >= self.compact_threshold:
+            self.compact()
+        return len(text)  # json.dumps escapes non-ASCII, so chars == bytes
+
+    def stored_bytes(self):
+        return file_size(self.path) + file_size(self.journal_path) + file_size(self.rotated_path)
+
+    def compact(self, wait=False):
+        if self.compactor and self.compactor.is_alive():
+            return False
+        if os.path.exists(self.rotated_path):
+            # A previous compaction died before finishing; fold it in first.
+            compact_snapshot(self.path, self.rotated_path, self.fsync)
+        self.journal.close()
+        os.replace(self.journal_path, self.rotated_path)
+        self.journal = open(self.journal_path, "a")
+        self.journal_lines = 0
+        self.compactor = threading.Thread(
+            target=compact_snapshot, args=(self.path, self.rotated_path, self.fsync), name="journal-compactor"
+        )
+        self.compactor.start()
+        if wait:
+            self.compactor.join()
+        return True
+
+    def close(self):
+        if self.compactor:
+            self.compactor.join()
+        if self.journal:
+            self.journal.close()
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    uid TEXT PRIMARY KEY,
+    bal NUMERIC NOT NULL,
+    exp INTEGER NOT NULL,
+    lvl INTEGER NOT NULL,
+    daily INTEGER,
+    work INTEGER,
+    achievements TEXT NOT NULL,
+    job TEXT,
+    job_lvl INTEGER NOT NULL,
+    job_exp INTEGER NOT NULL,
+    daily_quests TEXT NOT NULL,
+    guilds TEXT NOT NULL DEFAULT '[]',
+    reminders TEXT NOT NULL DEFAULT '[]'
+);
+CREATE TABLE IF NOT EXISTS inv (uid TEXT NOT NULL, item TEXT NOT NULL, amount NUMERIC NOT NULL, PRIMARY KEY (uid, item));
+CREATE TABLE IF NOT EXISTS investments (uid TEXT NOT NULL, crypto TEXT NOT NULL, amount NUMERIC NOT NULL, PRIMARY KEY (uid, crypto));
+CREATE TABLE IF NOT EXISTS boosters (uid TEXT NOT NULL, name TEXT NOT NULL, expires INTEGER NOT NULL, PRIMARY KEY (uid, name));
+CREATE TABLE IF NOT EXISTS cooldowns (uid TEXT NOT NULL, name TEXT NOT NULL, stamp INTEGER NOT NULL, PRIMARY KEY (uid, name));
+"""
+
+# (table, record key) for the per-user child tables.
+SQLITE_CHILD_TABLES = [
+    ("inv", "inv"),
+    ("investments", "investments"),
+    ("boosters", "boosters"),
+    ("cooldowns", "cooldowns"),
+]
+
+# Statements are fixed strings so sqlite3's statement cache keeps them
+# prepared across writes.
+SQL_UPSERT_USER = (
+    "INSERT OR REPLACE INTO users (uid, bal, exp, lvl, daily, work, achievements, job, job_lvl, job_exp, daily_quests, guilds, reminders) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+SQL_DELETE_USER = "DELETE FROM users WHERE uid = ?"
+SQL_SELECT_USERS = (
+    "SELECT uid, bal, exp, lvl, daily, work, achievements, job, job_lvl, job_exp, daily_quests, guilds, reminders FROM users"
+)
+SQL_DELETE_CHILD = {table: f"DELETE FROM {table} WHERE uid = ?" for table, _ in SQLITE_CHILD_TABLES}
+SQL_INSERT_CHILD = {table: f"INSERT INTO {table} VALUES (?, ?, ?)" for table, _ in SQLITE_CHILD_TABLES}
+
+
+def sqlite_record(row):
+    # A users row as a record, with the child tables still to be filled in.
+    _, bal, exp, lvl, daily, work, achievements, job, job_lvl, job_exp, daily_quests, guilds, reminders = row
+    return {
+        "bal": bal, "exp": exp, "lvl": lvl, "daily": daily, "work": work, "inv": {},
+        "achievements": json.loads(achievements), "job": job, "job_lvl": job_lvl, "job_exp": job_exp,
+        "boosters": {}, "cooldowns": {}, "daily_quests": json.loads(daily_quests), "investments": {},
+        "guilds": json.loads(guilds), "reminders": json.loads(reminders),
+    }
+
+
+class SqliteBackend:
+    # One row per user plus one row per inventory item, investment, booster
+    # and cooldown. A write is a single transaction that only touches the
+    # rows of the users that changed.
+
+    full_snapshot = False
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=" + ("FULL" if fsync else "NORMAL"))
+        self.conn.executescript(SQLITE_SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(users)")}
+        for column in ("guilds", "reminders"):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE users ADD COLUMN {column} TEXT NOT NULL DEFAULT '[]'")
+
+    def load(self):
+        data = {}
+        for row in self.conn.execute(SQL_SELECT_USERS):
+            data[row[0]] = sqlite_record(row)
+        for table, key in SQLITE_CHILD_TABLES:
+            for uid, name, value in self.conn.execute(f"SELECT * FROM {table}"):
+                if uid in data:
+                    data[uid][key][name] = value
+        return data
+
+    def write(self, data, dirty):
+        # Returns the size of the row payload bound to the statements (text
+        # as is, numbers as 8 bytes); SQLite's own page writes aren't visible.
+        cur = self.conn.cursor()
+        written = 0
+        cur.execute("BEGIN")
+        try:
+            for uid in dirty:
+                user = data.get(uid)
+                for table, _ in SQLITE_CHILD_TABLES:
+                    cur.execute(SQL_DELETE_CHILD[table], (uid,))
+                if user is None:
+                    cur.execute(SQL_DELETE_USER, (uid,))
+                    continue
+                user = {**DEFAULT_RECORD, **user}  # records are sparse, the columns aren't
+                row = (
+                    uid, user["bal"], user["exp"], user["lvl"], user["daily"], user["work"],
+                    json.dumps(user["achievements"]), user["job"], user["job_lvl"], user["job_exp"],
+                    json.dumps(user["daily_quests"]), json.dumps(user["guilds"]), json.dumps(user["reminders"]),
+                )
+                cur.execute(SQL_UPSERT_USER, row)
+                written += payload_size(row)
+                for table, key in SQLITE_CHILD_TABLES:
+                    if user[key]:
+                        rows = [(uid, k, v) for k, v in user[key].items()]
+                        cur.executemany(SQL_INSERT_CHILD[table], rows)
+                        written += sum(payload_size(r) for r in rows)
+            cur.execute("COMMIT")
+        except BaseException:
+            cur.execute("ROLLBACK")
+            raise
+        return written
+
+    def stored_bytes(self):
+        return file_size(self.path) + file_size(self.path + "-wal")
+
+    def close(self):
+        self.conn.close()
+
+
+def payload_size(row):
+    return sum(len(v) if isinstance(v, str) else 8 for v in row if v is not None)
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def write_json_atomic(path, data, fsync=False, **dump_kwargs):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, **dump_kwargs)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def replay_journal(path, data):
+    # Applies every complete line of the journal at path to data. A torn last
+    # line (the process was killed mid-write) is cut off so later appends
+    # start on a clean line.
+    count = 0
+    good = 0
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return 0
+    with f:
+        for line in f:
+            try:
+                uid, record = json.loads(line)
+            except ValueError:
+                break
+            if record is None:
+                data.pop(uid, None)
+            else:
+                data[uid] = record
+            good += len(line)
+            count += 1
+    if good != os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(good)
+    return count
+
+
+def compact_snapshot(path, rotated_path, fsync=False):
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        data = {}
+    replay_journal(rotated_path, data)
+    write_json_atomic(path, data, fsync, separators=(",", ":"))
+    os.remove(rotated_path)
+
+
+BACKENDS = {
+    "json": JsonBackend,
+    "journal": JournalBackend,
+    "sqlite": SqliteBackend,
+}
+
+
+def backend_path(data_file, mode):
+    # The SQLite database lives next to economy.json as economy.db so both
+    # can coexist while migrating.
+    if mode == "sqlite":
+        return os.path.splitext(data_file)[0] + ".db"
+    return data_file
+
+
+def open_backend(data_file, mode="json", **kwargs):
+    if mode not in BACKENDS:
+        raise ValueError(f"Unknown storage mode {mode!r}, expected one of: {', '.join(BACKENDS)}")
+    return BACKENDS[mode](backend_path(data_file, mode), **kwargs)
+
+
+def open_store(data_file, mode="json", flush_interval=30, flush_threshold=500, io_workers=2, metrics=None, **backend_kwargs):
+    return EconomyStore(open_backend(data_file, mode, **backend_kwargs), flush_interval, flush_threshold, io_workers, metrics)